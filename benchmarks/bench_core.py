@@ -0,0 +1,351 @@
+"""Замеры основных операций базы на синтетических таблицах.
+
+Запуск из корня проекта:
+    PYTHONPATH=src python benchmarks/bench_core.py --sizes 1000 100000 \
+        --output results.json --baseline baseline.json
+
+Для каждого размера таблицы измеряются пропускная способность, задержки
+(p50/p95/p99) и пиковая память. С --baseline результаты сравниваются с
+сохраненными ранее; при регрессии скрипт завершается с кодом 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import primitive_db
+from primitive_db.core import (
+    create_index,
+    create_table,
+    delete,
+    insert,
+    insert_many,
+    select,
+    update,
+)
+from primitive_db.decorators import configure
+from primitive_db.query import parse_where_clause
+from primitive_db.rows import RowList
+from primitive_db.utils import load_table, save_table_data
+
+TABLE = "bench"
+COLUMNS = ["name:str", "age:int", "active:bool"]
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# Сколько раз повторяется точечная операция для расчета перцентилей
+DEFAULT_OPS = 200
+# Запусков программы для замера времени старта и цель для его медианы, мс
+STARTUP_RUNS = 20
+STARTUP_TARGET_MS = 100
+# Ухудшения меньше этих абсолютных величин считаются шумом измерений:
+# доли процента от задержек в десятки микросекунд и от запуска процесса
+MIN_DELTA = {"p50_ms": 0.05, "p95_ms": 0.05, "peak_kib": 64}
+STARTUP_MIN_DELTA_MS = 5
+
+
+def make_rows(count, rng):
+    """Генерирует строки таблицы: имя из 1000 вариантов, возраст 0-99."""
+    return [
+        (f"user{rng.randrange(1000)}", str(rng.randrange(100)), rng.random() < 0.5)
+        for _ in range(count)
+    ]
+
+
+def percentile(samples, fraction):
+    """Возвращает перцентиль выборки (fraction от 0 до 1)."""
+    ordered = sorted(samples)
+    position = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[position]
+
+
+def measure(name, rows, operation, ops, units_per_op=1):
+    """Выполняет operation ops раз и один раз под tracemalloc.
+
+    Возвращает словарь с пропускной способностью (единиц в секунду),
+    перцентилями задержки в миллисекундах и пиковой памятью в КиБ.
+    """
+    latencies = []
+    for i in range(ops):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    operation(ops)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(latencies)
+    return {
+        "name": name,
+        "rows": rows,
+        "ops": ops,
+        "throughput": units_per_op * ops / total if total else None,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def bench_size(size, ops, seed):
+    """Замеряет операции на таблице из size строк."""
+    rng = random.Random(seed)
+    metadata = {}
+    create_table(metadata, TABLE, COLUMNS)
+    rows = make_rows(size, rng)
+    results = []
+
+    def bulk_insert(_):
+        data, header = RowList(), {}
+        insert_many(metadata, data, TABLE, rows, {}, header)
+        return data, header
+
+    results.append(
+        measure("insert_many", size, bulk_insert, ops=3, units_per_op=size)
+    )
+    table_data, header = bulk_insert(0)
+    indexes = {}
+    create_index(metadata, table_data, TABLE, "age", indexes)
+
+    def insert_one(i):
+        insert(metadata, table_data, TABLE, (f"new{i}", "42", True), indexes, header)
+
+    results.append(measure("insert", size, insert_one, ops))
+
+    # Выборки разной селективности: по ID, по индексу, полный просмотр
+    queries = {
+        "select_by_id": lambda i: f"ID = {rng.randrange(1, size + 1)}",
+        "select_index_eq_1pct": lambda i: f"age = {i % 100}",
+        "select_scan_eq_0.1pct": lambda i: f"name = 'user{i % 1000}'",
+        "select_scan_range_50pct": lambda i: "active = true and name >= 'user5'",
+    }
+    for name, make_where in queries.items():
+
+        def run_select(i, make_where=make_where):
+            where = make_where(i)
+            select(table_data, metadata, TABLE, _parse(where), indexes)
+
+        results.append(measure(name, size, run_select, ops))
+
+    def update_one(i):
+        where = _parse(f"ID = {rng.randrange(1, size + 1)}")
+        update(table_data, metadata, TABLE, {"age": "7"}, where, indexes)
+
+    results.append(measure("update_by_id", size, update_one, ops))
+
+    # Массовое обновление около 1% строк, найденных через индекс
+    def update_bulk(i):
+        where = _parse(f"age = {i % 100}")
+        update(table_data, metadata, TABLE, {"active": "false"}, where, indexes)
+
+    results.append(measure("update_bulk_1pct", size, update_bulk, ops))
+
+    def delete_one(i):
+        where = _parse(f"ID = {size - i}")
+        delete(table_data, metadata, TABLE, where, indexes)
+
+    results.append(measure("delete_by_id", size, delete_one, min(ops, size - 1)))
+
+    # Сохранение и загрузка: единица пропускной способности - строка
+    def save(_):
+        save_table_data(TABLE, table_data, indexes, header)
+
+    results.append(
+        measure("save_table_data", size, save, ops=3, units_per_op=len(table_data))
+    )
+
+    def load(_):
+        load_table(TABLE)
+
+    results.append(
+        measure("load_table", size, load, ops=3, units_per_op=len(table_data))
+    )
+
+    # То же в колоночном формате: строки словарем, столбцы сжаты
+    header["storage"] = "columnar"
+    results.append(
+        measure(
+            "save_table_columnar", size, save, ops=3, units_per_op=len(table_data)
+        )
+    )
+    results.append(
+        measure(
+            "load_table_columnar", size, load, ops=3, units_per_op=len(table_data)
+        )
+    )
+
+    # Массовое удаление около 1% строк за раз; идет последним, так как
+    # при большом числе повторов опустошает таблицу
+    def delete_bulk(i):
+        delete(table_data, metadata, TABLE, _parse(f"age = {i}"), indexes)
+
+    results.append(measure("delete_bulk_1pct", size, delete_bulk, min(ops, 99)))
+    return results
+
+
+def bench_startup(runs):
+    """Замеряет запуск программы с одной командой в пакетном режиме."""
+    with open("startup.txt", "w", encoding="utf-8") as f:
+        f.write("list_tables\n")
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.dirname(os.path.dirname(primitive_db.__file__)),
+    )
+    command = [sys.executable, "-m", "primitive_db.main", "-f", "startup.txt"]
+
+    def start(_):
+        subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    return measure("startup", 0, start, runs)
+
+
+def _parse(where_text):
+    return parse_where_clause(f"where {where_text}")
+
+
+def compare(results, baseline, tolerance):
+    """Сравнивает результаты с базовыми; возвращает список регрессий.
+
+    Регрессия - ухудшение больше допуска tolerance относительно базы и
+    одновременно больше абсолютного порога шума (MIN_DELTA).
+    """
+    previous = {(item["name"], item["rows"]): item for item in baseline["results"]}
+    regressions = []
+    for item in results:
+        base = previous.get((item["name"], item["rows"]))
+        if base is None:
+            continue
+        for metric, min_delta in MIN_DELTA.items():
+            if item["name"] == "startup" and metric != "peak_kib":
+                min_delta = STARTUP_MIN_DELTA_MS
+            if (
+                base[metric]
+                and item[metric] > base[metric] * (1 + tolerance)
+                and item[metric] - base[metric] >= min_delta
+            ):
+                regressions.append(
+                    f"{item['name']} ({item['rows']} строк): {metric} "
+                    f"{base[metric]:.3f} -> {item[metric]:.3f}"
+                )
+    return regressions
+
+
+def _startup_regressed(startup, baseline, args):
+    if startup["p50_ms"] > args.startup_target:
+        return True
+    return baseline is not None and bool(
+        compare([startup], baseline, args.tolerance)
+    )
+
+
+def retry_startup(startup, again):
+    """Оставляет в замере запуска лучшие задержки из двух попыток."""
+    for metric in ("mean_ms", "p50_ms", "p95_ms", "p99_ms"):
+        startup[metric] = min(startup[metric], again[metric])
+
+
+def print_results(results):
+    """Печатает результаты таблицей."""
+    header = (
+        f"{'операция':<26}{'строк':>10}{'ед./с':>14}"
+        f"{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'память, КиБ':>13}"
+    )
+    print(header)
+    for item in results:
+        throughput = item["throughput"] or 0
+        print(
+            f"{item['name']:<26}{item['rows']:>10}{throughput:>14.0f}"
+            f"{item['p50_ms']:>10.3f}{item['p95_ms']:>10.3f}"
+            f"{item['p99_ms']:>10.3f}{item['peak_kib']:>13.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры операций базы данных.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="размеры таблиц"
+    )
+    parser.add_argument(
+        "--ops", type=int, default=DEFAULT_OPS, help="повторов точечных операций"
+    )
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора")
+    parser.add_argument(
+        "--startup-target",
+        type=float,
+        default=STARTUP_TARGET_MS,
+        help="допустимая медиана времени запуска программы, мс",
+    )
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON с базовыми результатами")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="допустимое ухудшение относительно базы (0.2 = 20%%)",
+    )
+    args = parser.parse_args()
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    configure(auto_confirm=True, quiet=True)
+    results = []
+    workdir = os.getcwd()
+    with tempfile.TemporaryDirectory() as tempdir:
+        # Файлы таблиц пишутся во временный каталог, а не в data/ проекта
+        os.chdir(tempdir)
+        try:
+            for size in args.sizes:
+                results.extend(bench_size(size, args.ops, args.seed))
+            startup = bench_startup(STARTUP_RUNS)
+            if _startup_regressed(startup, baseline, args):
+                # Запуск процесса сильно зависит от фона машины: перед
+                # сообщением о регрессии замер повторяется
+                retry_startup(startup, bench_startup(STARTUP_RUNS))
+            results.append(startup)
+        finally:
+            os.chdir(workdir)
+
+    print_results(results)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "ops": args.ops,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+    regressions = []
+    if startup["p50_ms"] > args.startup_target:
+        regressions.append(
+            f"запуск: медиана {startup['p50_ms']:.1f} мс "
+            f"больше цели {args.startup_target:.0f} мс"
+        )
+    if baseline is not None:
+        regressions.extend(compare(results, baseline, args.tolerance))
+    if regressions:
+        print("\nРегрессии:")
+        for line in regressions:
+            print(f"- {line}")
+        sys.exit(1)
+    print("\nРегрессий нет.")
+
+
+if __name__ == "__main__":
+    main()
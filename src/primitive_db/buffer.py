@@ -0,0 +1,311 @@
+"""Пул таблиц, загруженных в память."""
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, nullcontext
+
+from .constants import (
+    BUFFER_POOL_MAX_ROWS,
+    DB_META_PATH,
+    TRANSACTION_LOCK_TIMEOUT,
+)
+from .locks import metadata_lock, table_lock
+from .utils import (
+    automatic_checkpoints,
+    checkpoint_due,
+    count_table_rows,
+    get_file_stamp,
+    get_table_file_paths,
+    load_metadata,
+    load_table,
+    open_table,
+    remove_table_files,
+    save_metadata,
+    save_table_change,
+    save_table_changes,
+    save_table_data,
+)
+from .wal import has_changes, remove_journal, write_journal
+
+
+class BufferPool:
+    """Держит разобранные таблицы и метаданные между командами.
+
+    Перед выдачей таблицы ее свежесть проверяется по времени изменения и
+    размеру файлов, так что изменения другого процесса не теряются.
+    Изменения сразу дописываются в журнал, и его достаточно для их
+    сохранности. Контрольная точка таблицы ("грязной", пока журнал не
+    свернут) при вытеснении из пула или при сбросе на выходе записывается,
+    только если журнал дорос до порога configure_checkpoints или таблица
+    восстановлена после сбоя; иначе - командой checkpoint. Так короткие
+    запуски с одним изменением не переписывают снимок целиком. Объем пула
+    ограничен числом строк.
+
+    Изменение таблицы выполняется под lock_table: под исключительной
+    блокировкой get_table перечитывает таблицу, если ее успел изменить
+    другой процесс, и чужие изменения не затираются.
+
+    Внутри транзакции (begin) изменения копятся в памяти, а блокировки
+    измененных таблиц удерживаются до commit или rollback.
+    """
+
+    def __init__(self, max_rows=BUFFER_POOL_MAX_ROWS):
+        self.max_rows = max_rows
+        self._tables = OrderedDict()
+        self._metadata = None
+        self._metadata_stamp = None
+        self._seen_stamps = {}
+        self._transaction = None
+
+    def lock_metadata(self):
+        """Блокирует метаданные для изменения другими процессами."""
+        return metadata_lock(exclusive=True)
+
+    def lock_table(self, table_name):
+        """Блокирует таблицу для изменения другими процессами."""
+        if self._transaction is None:
+            return table_lock(table_name, exclusive=True)
+
+        # В транзакции блокировка удерживается до ее завершения
+        if table_name not in self._transaction["locked"]:
+            self._transaction["locks"].enter_context(
+                table_lock(
+                    table_name, exclusive=True, timeout=TRANSACTION_LOCK_TIMEOUT
+                )
+            )
+            self._transaction["locked"].add(table_name)
+        return nullcontext()
+
+    def in_transaction(self):
+        """Проверяет, начата ли транзакция."""
+        return self._transaction is not None
+
+    def begin(self):
+        """Начинает транзакцию."""
+        self._transaction = {"changes": {}, "locked": set(), "locks": ExitStack()}
+
+    def commit(self):
+        """Фиксирует изменения транзакции и возвращает их число.
+
+        Сначала все изменения сохраняются в журнал фиксации, затем
+        дописываются в журналы таблиц (по одной записи на таблицу), после
+        чего журнал фиксации удаляется. Если процесс прервется посередине,
+        изменения допишет recover_transactions при следующем запуске.
+        """
+        transaction, self._transaction = self._transaction, None
+        changes = transaction["changes"]
+        try:
+            if changes:
+                txn_id = max(
+                    time.time_ns(),
+                    *(
+                        self._tables[table_name]["header"].get("last_txn", 0) + 1
+                        for table_name in changes
+                    ),
+                )
+                for table_changes in changes.values():
+                    for change in table_changes:
+                        change["txn"] = txn_id
+                write_journal(txn_id, changes)
+
+                for table_name, table_changes in changes.items():
+                    entry = self._tables[table_name]
+                    entry["header"]["last_txn"] = txn_id
+                    save_table_changes(
+                        table_name,
+                        table_changes,
+                        entry["data"],
+                        entry["indexes"],
+                        entry["header"],
+                    )
+                    entry["stamp"] = self._stamp(table_name)
+                    entry["dirty"] = has_changes(table_name)
+                remove_journal(txn_id)
+        finally:
+            transaction["locks"].close()
+        self._evict(keep=None)
+        return sum(len(table_changes) for table_changes in changes.values())
+
+    def rollback(self):
+        """Отменяет транзакцию и возвращает имена затронутых таблиц."""
+        transaction, self._transaction = self._transaction, None
+        # Измененные в памяти таблицы будут перечитаны с диска
+        for table_name in transaction["changes"]:
+            self._tables.pop(table_name, None)
+        transaction["locks"].close()
+        return list(transaction["changes"])
+
+    def _pending_tables(self):
+        if self._transaction is None:
+            return ()
+        return self._transaction["changes"]
+
+    def get_metadata(self):
+        """Возвращает метаданные, перечитывая файл только после его изменения."""
+        stamp = get_file_stamp(DB_META_PATH)
+        if self._metadata is None or stamp != self._metadata_stamp:
+            self._metadata = load_metadata()
+            self._metadata_stamp = stamp
+        return self._metadata
+
+    def save_metadata(self, metadata):
+        """Сохраняет метаданные и запоминает отпечаток файла."""
+        save_metadata(metadata)
+        self._metadata = metadata
+        self._metadata_stamp = get_file_stamp(DB_META_PATH)
+
+    def _stamp(self, table_name):
+        return get_file_stamp(*get_table_file_paths(table_name))
+
+    def get_table(self, table_name, writable=False):
+        """Возвращает данные, индексы и заголовок таблицы.
+
+        Для чтения колоночная таблица может быть выдана лениво, через
+        отображение в память; для записи она всегда загружается в список.
+        """
+        entry = self._tables.get(table_name)
+        if (
+            entry is None
+            or entry["stamp"] != self._stamp(table_name)
+            or (writable and not isinstance(entry["data"], list))
+        ):
+            loader = load_table if writable else open_table
+            # Отпечаток снимается под той же блокировкой, что и чтение
+            with table_lock(table_name):
+                table_data, indexes, header = loader(table_name)
+                entry = {
+                    "data": table_data,
+                    "indexes": indexes,
+                    "header": header,
+                    "stamp": self._stamp(table_name),
+                    # Восстановленную из предыдущей точки таблицу нужно
+                    # записать заново, даже если журнал пуст
+                    "dirty": has_changes(table_name)
+                    or header.get("restored", False),
+                }
+            self._tables[table_name] = entry
+            self._evict(keep=table_name)
+
+        self._tables.move_to_end(table_name)
+        return entry["data"], entry["indexes"], entry["header"]
+
+    def table_changed(self, table_name):
+        """Проверяет, менялись ли файлы таблицы с прошлой проверки."""
+        stamp = self._stamp(table_name)
+        changed = self._seen_stamps.get(table_name) != stamp
+        self._seen_stamps[table_name] = stamp
+        return changed
+
+    def count_rows(self, table_name):
+        """Возвращает число записей таблицы, не загружая ее без нужды."""
+        entry = self._tables.get(table_name)
+        if entry is not None and entry["stamp"] == self._stamp(table_name):
+            return len(entry["data"])
+        return count_table_rows(table_name)
+
+    def save_change(self, table_name, change):
+        """Дописывает изменение загруженной таблицы в журнал.
+
+        Внутри транзакции изменение только запоминается до commit.
+        """
+        if self._transaction is not None:
+            self._transaction["changes"].setdefault(table_name, []).append(change)
+            return
+        entry = self._tables[table_name]
+        with table_lock(table_name, exclusive=True):
+            save_table_change(
+                table_name,
+                change,
+                entry["data"],
+                entry["indexes"],
+                entry["header"],
+            )
+            entry["stamp"] = self._stamp(table_name)
+        entry["dirty"] = has_changes(table_name)
+        self._evict(keep=table_name)
+
+    def save_table(self, table_name, logged=True):
+        """Сразу записывает контрольную точку загруженной таблицы.
+
+        logged=False - в таблице есть изменения, не попавшие в журнал.
+        """
+        entry = self._tables[table_name]
+        with table_lock(table_name, exclusive=True):
+            save_table_data(
+                table_name,
+                entry["data"],
+                entry["indexes"],
+                entry["header"],
+                logged=logged,
+            )
+            entry["stamp"] = self._stamp(table_name)
+        entry["dirty"] = False
+
+    def drop_table(self, table_name):
+        """Забывает таблицу и удаляет ее файлы."""
+        self._tables.pop(table_name, None)
+        remove_table_files(table_name)
+
+    def flush(self):
+        """Записывает контрольные точки грязных таблиц, которым они нужны.
+
+        Незавершенная транзакция при этом отменяется. Изменения остальных
+        таблиц остаются в журналах (см. _write_back).
+        """
+        if self._transaction is not None:
+            self.rollback()
+        for table_name in list(self._tables):
+            self._write_back(table_name)
+
+    def checkpoint(self, table_names):
+        """Записывает контрольные точки таблиц с непустым журналом.
+
+        Возвращает имена таблиц, для которых точка записана.
+        """
+        written = []
+        for table_name in table_names:
+            with table_lock(table_name, exclusive=True):
+                # Таблица без изменений не загружается: иначе checkpoint без
+                # аргументов разбирал бы всю базу
+                entry = self._tables.get(table_name)
+                if not has_changes(table_name) and not (entry and entry["dirty"]):
+                    continue
+                self.get_table(table_name, writable=True)
+                self.save_table(table_name)
+                written.append(table_name)
+        return written
+
+    def _write_back(self, table_name):
+        """Переписывает снимок грязной таблицы, если ее не менял другой процесс.
+
+        Снимок переписывается, только если журнал дорос до порога
+        контрольной точки или таблица восстановлена из предыдущей точки.
+        """
+        entry = self._tables[table_name]
+        if not entry["dirty"] or table_name in self._pending_tables():
+            return
+        if not automatic_checkpoints() or not (
+            entry["header"].get("restored") or checkpoint_due(table_name)
+        ):
+            return
+        with table_lock(table_name, exclusive=True):
+            if entry["stamp"] == self._stamp(table_name):
+                self.save_table(table_name)
+
+    def _evict(self, keep):
+        """Вытесняет давно не использованные таблицы сверх лимита строк."""
+        # Отображенные в память таблицы не занимают места в куче
+        total_rows = sum(
+            len(entry["data"])
+            for entry in self._tables.values()
+            if isinstance(entry["data"], list)
+        )
+        for table_name in list(self._tables):
+            if total_rows <= self.max_rows:
+                break
+            if table_name == keep or table_name in self._pending_tables():
+                continue
+            entry = self._tables[table_name]
+            self._write_back(table_name)
+            if isinstance(entry["data"], list):
+                total_rows -= len(entry["data"])
+            del self._tables[table_name]
@@ -0,0 +1,93 @@
+"""Клиент сервера базы данных с пулом соединений."""
+import json
+import queue
+import socket
+import threading
+from contextlib import contextmanager
+
+from .constants import CLIENT_POOL_SIZE, SERVER_HOST
+
+
+class Connection:
+    """Соединение с сервером по Unix-сокету или TCP."""
+
+    def __init__(self, socket_path=None, host=SERVER_HOST, port=None, timeout=None):
+        if socket_path:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+        else:
+            sock = socket.create_connection((host, port), timeout)
+        self._socket = sock
+        self._file = sock.makefile("rwb")
+
+    def execute(self, command):
+        """Выполняет команду на сервере и возвращает ее вывод."""
+        request = json.dumps({"command": command}, ensure_ascii=False) + "\n"
+        self._file.write(request.encode("utf-8"))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Сервер закрыл соединение.")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ValueError(response["output"])
+        return response["output"]
+
+    def close(self):
+        """Закрывает соединение."""
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """Пул соединений с сервером.
+
+    Соединения открываются по требованию и после использования
+    возвращаются в пул; одновременно открыто не больше max_size.
+    """
+
+    def __init__(self, max_size=CLIENT_POOL_SIZE, **connect_args):
+        self._connect_args = connect_args
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @contextmanager
+    def connection(self):
+        """Выдает соединение из пула на время блока with."""
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = Connection(**self._connect_args)
+            broken = False
+            try:
+                yield conn
+            except OSError:
+                broken = True
+                raise
+            finally:
+                # Оборванное соединение в пул не возвращается
+                if broken:
+                    conn.close()
+                else:
+                    self._idle.put(conn)
+
+    def execute(self, command):
+        """Выполняет команду на любом свободном соединении пула."""
+        with self.connection() as conn:
+            return conn.execute(command)
+
+    def close(self):
+        """Закрывает все простаивающие соединения."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -4,6 +4,63 @@
 DB_META_PATH = "db_meta.json"
 DATA_DIR = "data"
 
+# Журнал изменений таблиц (WAL)
+# "always" - fsync после каждой записи, "never" - только сброс буфера
+WAL_FSYNC_POLICY = "always"
+# Размер журнала в байтах, после которого записывается контрольная точка
+WAL_COMPACT_THRESHOLD = 1024 * 1024
+
+# Форматы хранения снимков таблиц
+STORAGE_FORMATS = {"json", "columnar"}
+DEFAULT_STORAGE = "json"
+# Сжатие столбцов колоночных снимков: "zlib", "lzma" или None. Столбец
+# сжимается, если он не меньше MIN_SIZE байт и сжатие экономит не меньше
+# доли MIN_SAVING его размера
+COLUMNAR_COMPRESSION = "zlib"
+COLUMNAR_COMPRESSION_MIN_SIZE = 4096
+COLUMNAR_COMPRESSION_MIN_SAVING = 0.2
+
+# Сколько секунд транзакция ждет блокировку таблицы, занятой другим процессом
+TRANSACTION_LOCK_TIMEOUT = 10
+
+# Параллельный просмотр: число процессов (0 - по числу ядер) и размер
+# таблицы, начиная с которого полный просмотр делится между процессами
+PARALLEL_WORKERS = 0
+PARALLEL_SCAN_THRESHOLD = 500_000
+
+# Векторный просмотр по столбцам: размер таблицы, начиная с которого
+# условие проверяется сразу по столбцам, и использование NumPy, если он есть
+VECTOR_SCAN_THRESHOLD = 10_000
+VECTOR_USE_NUMPY = True
+
+# Сколько записей может войти в хеш-таблицу соединения (join); при большем
+# числе записей стороны соединения раскладываются по временным файлам
+JOIN_BUILD_MAX_ROWS = 500_000
+
+# Сколько функций показывает команда profile
+PROFILE_TOP_FUNCTIONS = 20
+
+# Сервер: Unix-сокет, локальный TCP-порт и предел длины строки запроса
+SERVER_SOCKET_PATH = "primitive_db.sock"
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 7435
+SERVER_LINE_LIMIT = 16 * 1024 * 1024
+# Число соединений, которое клиентский пул держит открытыми
+CLIENT_POOL_SIZE = 4
+
+# Ограничения кэша результатов select
+CACHE_MAX_ENTRIES = 128
+CACHE_MAX_ROWS = 100_000
+
+# Предел суммарного числа строк таблиц в пуле памяти
+BUFFER_POOL_MAX_ROWS = 1_000_000
+
+# Размер порции строк при пакетной вставке и импорте
+INSERT_BATCH_SIZE = 10_000
+
+# Число записей на странице при постраничном выводе select
+PAGE_SIZE = 20
+
 # Поддерживаемые типы данных
 SUPPORTED_TYPES = {"int", "str", "bool"}
 
@@ -16,11 +73,30 @@ HELP_MESSAGE = (
     "<command> create_table <имя_таблицы> <столбец1:тип> ... - создать таблицу\n"
     "<command> list_tables - показать список всех таблиц\n"
     "<command> drop_table <имя_таблицы> - удалить таблицу\n"
-    "<command> insert into <имя_таблицы> values (...) - создать запись\n"
-    "<command> select from <имя_таблицы> [where ...] - прочитать записи\n"
+    "<command> insert into <имя_таблицы> values (...), ... - создать записи\n"
+    "<command> import <имя_таблицы> <файл.csv|файл.jsonl> - импорт записей\n"
+    "<command> select [<столбец>, ...] from <имя_таблицы> [where ...] "
+    "[limit N] [offset M] "
+    "[paged] - прочитать записи\n"
+    "<command> select [<столбец>, ...] count(*)|sum|min|max|avg(<столбец>), ... "
+    "from <имя_таблицы> [where ...] [group by <столбец>, ...] - агрегаты\n"
+    "<command> select [<таблица>.<столбец>, ...] from <таблица1> join <таблица2> "
+    "on <таблица1>.<столбец> = <таблица2>.<столбец> [where ...] - соединение\n"
+    "<command> export <имя_таблицы> [where ...] to <файл> as csv|jsonl "
+    "- экспорт записей\n"
     "<command> update <имя_таблицы> set ... where ... - обновить запись\n"
     "<command> delete from <имя_таблицы> where ... - удалить запись\n"
     "<command> info <имя_таблицы> - вывести информацию о таблице\n"
+    "<command> create_index <имя_таблицы> <столбец> - создать индекс\n"
+    "<command> migrate <имя_таблицы|*> <json|columnar> - сменить формат\n"
+    "<command> checkpoint [<имя_таблицы>] - свернуть журналы в снимки\n"
+    "<command> cache_stats - статистика кэша select\n"
+    "<command> stats [json [<файл>] | reset] - счетчики и задержки операций\n"
+    "<command> explain analyze <команда> - выполнить команду и показать "
+    "время по фазам\n"
+    "<command> profile <команда> - выполнить команду под cProfile\n"
+    "<command> begin | commit | rollback - начать, зафиксировать или отменить "
+    "транзакцию\n"
     "<command> exit - выход из программы\n"
     "<command> help - справочная информация"
 )
@@ -35,4 +111,10 @@ ERROR_MESSAGES = {
     "invalid_value": 'Некорректное значение: "{}". Попробуйте снова.',
     "wrong_value_count": "Ошибка: Количество значений не соответствует столбцам.",
     "invalid_value_for_type": "Ошибка: Неверное значение '{}' для типа '{}'.",
+    "column_not_exists": 'Ошибка: Столбец "{}" не существует.',
+    "index_exists": 'Ошибка: Индекс по столбцу "{}" уже существует.',
+    "invalid_storage": (
+        'Некорректный формат хранения: "{}". Поддерживаемые форматы: '
+        "json, columnar."
+    ),
 }
\ No newline at end of file
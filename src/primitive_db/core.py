@@ -1,6 +1,31 @@
-
-from .constants import AUTO_ID_COLUMN, ERROR_MESSAGES, SUPPORTED_TYPES
+from itertools import islice
+
+from .constants import (
+    AUTO_ID_COLUMN,
+    ERROR_MESSAGES,
+    INSERT_BATCH_SIZE,
+    JOIN_BUILD_MAX_ROWS,
+    STORAGE_FORMATS,
+    SUPPORTED_TYPES,
+)
 from .decorators import confirm_action, handle_db_errors, log_time
+from .indexes import build_index, index_lookup, records_by_ids
+from .join import hash_join, index_join
+from .metrics import increment, timed
+from .parallel import parallel_aggregate, parallel_filter, should_parallelize
+from .query import (
+    aggregate_records,
+    compile_predicate,
+    finalize_groups,
+    item_label,
+    iter_where,
+    rename_columns,
+    uses_index,
+    where_columns,
+)
+from .rows import column_getter, row_type
+from .vector import can_vectorize
+from .wal import apply_change
 
 
 @handle_db_errors
@@ -61,107 +86,699 @@ def validate_column_format(column):
     return True, name.strip(), type_.strip()
 
 
-def _cast_value(value, target_type):
-    """Приводит значение к заданному типу."""
+def _cast_int(value):
     try:
-        if target_type == "int":
-            return int(value)
-        if target_type == "bool":
-            if isinstance(value, str):
-                return value.lower() in ["true", "1", "t", "y", "yes"]
-            return bool(value)
-        if target_type == "str":
-            return str(value).strip("'\"")
-        return value
-    except (ValueError, AttributeError):
+        return int(value)
+    except (ValueError, TypeError):
         return None
 
 
-def get_column_type(metadata, table_name, column_name):
-    """Получает тип столбца из метаданных."""
-    if table_name in metadata:
+def _cast_bool(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value.lower() in ["true", "1", "t", "y", "yes"]
+    return bool(value)
+
+
+def _cast_str(value):
+    if value is None:
+        return None
+    return str(value).strip("'\"")
+
+
+# Функции приведения значений к типам столбцов; ошибка приведения - None.
+# Пустое значение (null в JSON, нет поля в строке CSV) некорректно для
+# любого типа
+TYPE_CASTERS = {"int": _cast_int, "bool": _cast_bool, "str": _cast_str}
+
+
+def _same(value):
+    return value
+
+
+def _cast_value(value, target_type):
+    """Приводит значение к заданному типу."""
+    return TYPE_CASTERS.get(target_type, _same)(value)
+
+
+class TableSchema:
+    """Столбцы таблицы, разобранные из метаданных один раз.
+
+    Хранит имена и типы столбцов, функции приведения значений для вставки
+    и класс записей таблицы.
+    """
+
+    __slots__ = ("names", "types", "columns", "make_row")
+
+    def __init__(self, column_defs):
+        self.types = {}
+        for column in column_defs:
+            name, col_type = column.split(":")
+            self.types[name] = col_type
+        self.names = tuple(self.types)
+        # Столбцы, значения которых задаются при вставке: (имя, тип, приведение)
+        self.columns = [
+            (name, self.types[name], TYPE_CASTERS.get(self.types[name], _same))
+            for name in self.names[1:]
+        ]
+        self.make_row = row_type([name for name, _, _ in self.columns] + ["ID"])
+
+    def column_type(self, column_name):
+        """Возвращает тип столбца или None, если столбца нет."""
         # ID - всегда инт тип для упрощения
         if column_name.upper() == "ID":
             return "int"
-        for column in metadata[table_name]:
-            name, type = column.split(":")
-            if name == column_name:
-                return type
+        return self.types.get(column_name)
+
+
+_schemas = {}
+
+
+def get_schema(metadata, table_name):
+    """Возвращает схему таблицы.
+
+    Схема разбирается один раз для каждого описания столбцов: при
+    изменении метаданных таблицы строится новая.
+    """
+    column_defs = tuple(metadata[table_name])
+    schema = _schemas.get(column_defs)
+    if schema is None:
+        schema = TableSchema(column_defs)
+        _schemas[column_defs] = schema
+    return schema
+
+
+def get_column_type(metadata, table_name, column_name):
+    """Получает тип столбца из метаданных."""
+    if table_name in metadata:
+        return get_schema(metadata, table_name).column_type(column_name)
     return None
 
 
+def _bind_where(where, metadata, table_name):
+    """Приводит значения в условии к типам столбцов.
+
+    Приведение выполняется один раз на запрос, а не для каждой записи.
+    Принимает дерево из query.parse_where_clause или условие старого вида
+    {столбец: значение}.
+    """
+    if where is None:
+        return None
+    if isinstance(where, dict):
+        (column, value), = where.items()
+        where = ("cmp", column, "=", value)
+    with timed("cast"):
+        return _bind_node(where, _column_resolver(metadata, table_name))
+
+
+def _column_resolver(metadata, table_name):
+    """Возвращает функцию: столбец таблицы -> (каноническое имя, тип)."""
+    def resolve(column):
+        col_type = get_column_type(metadata, table_name, column)
+        if not col_type:
+            raise ValueError(f'Столбец "{column}" не существует.')
+        return ("ID" if column.upper() == "ID" else column), col_type
+    return resolve
+
+
+def _bind_node(where, resolve):
+    """Приводит значения в узле условия и его потомках."""
+    kind = where[0]
+    if kind in ("and", "or"):
+        return (kind, tuple(_bind_node(node, resolve) for node in where[1]))
+
+    column, col_type = resolve(where[1])
+    if kind == "in":
+        return (
+            "in",
+            column,
+            tuple(_cast_value(value, col_type) for value in where[2]),
+        )
+    if kind == "between":
+        return (
+            "between",
+            column,
+            _cast_value(where[2], col_type),
+            _cast_value(where[3], col_type),
+        )
+    return ("cmp", column, where[2], _cast_value(where[3], col_type))
+
+
+def _resolve_columns(metadata, table_name, columns):
+    """Проверяет столбцы проекции и приводит ID к каноническому виду."""
+    resolved = []
+    for column in columns:
+        if not get_column_type(metadata, table_name, column):
+            raise ValueError(f'Столбец "{column}" не существует.')
+        resolved.append("ID" if column.upper() == "ID" else column)
+    return resolved
+
+
+@handle_db_errors
+def create_index(metadata, table_data, table_name, column, indexes):
+    """Создает индекс по столбцу таблицы."""
+    if table_name not in metadata:
+        return False, ERROR_MESSAGES["table_not_exists"].format(table_name)
+    if not get_column_type(metadata, table_name, column):
+        return False, ERROR_MESSAGES["column_not_exists"].format(column)
+    (column,) = _resolve_columns(metadata, table_name, [column])
+    if column == "ID":
+        return False, "Столбец ID уже проиндексирован."
+    if column in indexes:
+        return False, ERROR_MESSAGES["index_exists"].format(column)
+
+    indexes[column] = build_index(table_data, column)
+    return True, (
+        f'Индекс по столбцу "{column}" таблицы "{table_name}" успешно создан.'
+    )
+
+
+@handle_db_errors
+def set_table_storage(metadata, table_name, storage, header):
+    """Меняет формат хранения таблицы в ее заголовке."""
+    if table_name not in metadata:
+        return False, ERROR_MESSAGES["table_not_exists"].format(table_name)
+    if storage not in STORAGE_FORMATS:
+        return False, ERROR_MESSAGES["invalid_storage"].format(storage)
+
+    header["storage"] = storage
+    return True, f'Таблица "{table_name}" переведена в формат "{storage}".'
+
+
+def _next_id(table_data, header):
+    """Возвращает следующий свободный ID из заголовка таблицы."""
+    if "next_id" not in header:
+        last_id = max((record["ID"] for record in table_data), default=0)
+        header["next_id"] = last_id + 1
+    return header["next_id"]
+
+
 @handle_db_errors
 @log_time
-def insert(metadata, table_data, table_name, values):
+def insert(metadata, table_data, table_name, values, indexes=None, header=None):
     """Вставляет новую запись в таблицу."""
     if table_name not in metadata:
-        return False, ERROR_MESSAGES["table_not_exists"].format(table_name), None
-
-    columns = metadata[table_name]
-    #NOTE: -1 
-    if len(values) != len(columns) - 1:
-        return False, ERROR_MESSAGES["wrong_value_count"], None
-
-    new_record = {}
-    for i, column_def in enumerate(columns[1:]):
-        col_name, col_type = column_def.split(":")
-        value = _cast_value(values[i], col_type)
-        if value is None:
-            return (
-                False,
-                ERROR_MESSAGES["invalid_value_for_type"].format(values[i], col_type),
-                None,
-            )
-        new_record[col_name] = value
-
-    new_id = max([record.get("ID", 0) for record in table_data] + [0]) + 1
-    new_record["ID"] = new_id
+        return (
+            False,
+            ERROR_MESSAGES["table_not_exists"].format(table_name),
+            None,
+            None,
+        )
 
-    table_data.append(new_record)
+    schema = get_schema(metadata, table_name)
+    if len(values) != len(schema.columns):
+        return False, ERROR_MESSAGES["wrong_value_count"], None, None
+
+    cast_values = []
+    with timed("cast"):
+        for value, (_, col_type, cast) in zip(values, schema.columns):
+            cast_value = cast(value)
+            if cast_value is None:
+                return (
+                    False,
+                    ERROR_MESSAGES["invalid_value_for_type"].format(
+                        value, col_type
+                    ),
+                    None,
+                    None,
+                )
+            cast_values.append(cast_value)
+
+    if header is None:
+        header = {}
+    new_id = _next_id(table_data, header)
+    new_record = schema.make_row((*cast_values, new_id))
+
+    change = {"op": "insert", "records": [new_record]}
+    apply_change(table_data, change, indexes, header)
+    increment("rows.inserted")
     return (
         True,
         f'Запись с ID={new_id} успешно добавлена в таблицу "{table_name}".',
         table_data,
+        change,
+    )
+
+
+@handle_db_errors
+@log_time
+def insert_many(
+    metadata, table_data, table_name, rows, indexes=None, header=None
+):
+    """Вставляет пачку записей в таблицу одним изменением.
+
+    Строки читаются порциями по INSERT_BATCH_SIZE, значения каждой порции
+    приводятся к типам столбец за столбцом. Если хотя бы одно значение
+    некорректно, таблица не меняется.
+    """
+    if table_name not in metadata:
+        return (
+            False,
+            ERROR_MESSAGES["table_not_exists"].format(table_name),
+            None,
+            None,
+        )
+    if header is None:
+        header = {}
+
+    schema = get_schema(metadata, table_name)
+    next_id = _next_id(table_data, header)
+    new_records = []
+
+    rows = iter(rows)
+    while batch := list(islice(rows, INSERT_BATCH_SIZE)):
+        if any(len(values) != len(schema.columns) for values in batch):
+            return False, ERROR_MESSAGES["wrong_value_count"], None, None
+
+        cast_columns = []
+        for i, (_, col_type, cast) in enumerate(schema.columns):
+            raw_values = [values[i] for values in batch]
+            with timed("cast"):
+                cast_values = list(map(cast, raw_values))
+            if None in cast_values:
+                bad_value = raw_values[cast_values.index(None)]
+                return (
+                    False,
+                    ERROR_MESSAGES["invalid_value_for_type"].format(
+                        bad_value, col_type
+                    ),
+                    None,
+                    None,
+                )
+            cast_columns.append(cast_values)
+
+        for values in zip(*cast_columns):
+            new_records.append(schema.make_row((*values, next_id)))
+            next_id += 1
+
+    if not new_records:
+        return False, "Нет записей для добавления.", None, None
+
+    change = {"op": "insert", "records": new_records}
+    apply_change(table_data, change, indexes, header)
+    increment("rows.inserted", len(new_records))
+    first_id, last_id = new_records[0]["ID"], new_records[-1]["ID"]
+    return (
+        True,
+        f'В таблицу "{table_name}" добавлено записей: {len(new_records)} '
+        f"(ID {first_id}-{last_id}).",
+        table_data,
+        change,
     )
 
 
+def _scan_in_parallel(table_data, where, indexes):
+    """Проверяет, нужен ли полный просмотр, который стоит распараллелить.
+
+    Просмотр по столбцам (см. vector) быстрее запуска процессов, поэтому
+    условия, которые он вычисляет, не распараллеливаются.
+    """
+    if where is not None and (
+        uses_index(where, indexes or {}) or can_vectorize(table_data, where)
+    ):
+        return False
+    return should_parallelize(table_data)
+
+
+def iter_select(
+    table_data,
+    metadata,
+    table_name,
+    where_clause=None,
+    indexes=None,
+    parallel=False,
+):
+    """Возвращает итератор по записям, удовлетворяющим условию.
+
+    При parallel=True полный просмотр большой таблицы выполняется в
+    нескольких процессах; тогда записи отбираются сразу, а не лениво.
+    """
+    where = _bind_where(where_clause, metadata, table_name)
+    if parallel and where is not None and _scan_in_parallel(
+        table_data, where, indexes
+    ):
+        return iter(parallel_filter(table_data, where))
+    return iter_where(table_data, where, indexes)
+
+
 @handle_db_errors
 @log_time
-def select(table_data, metadata, table_name, where_clause=None):
-    """Выбирает записи из таблицы."""
-    if not where_clause:
+def select(
+    table_data,
+    metadata,
+    table_name,
+    where_clause=None,
+    indexes=None,
+    limit=None,
+    offset=0,
+    columns=None,
+    lazy=False,
+):
+    """Выбирает записи из таблицы, начиная с offset и не более limit.
+
+    Если заданы столбцы, записи в результате содержат только их. При
+    lazy=True возвращается итератор, и записи читаются по мере обхода.
+    """
+    if not (where_clause or limit is not None or offset or columns or lazy):
         return table_data
 
-    results = []
-    where_key, where_value_str = list(where_clause.items())[0]
+    # С limit или при ленивом обходе выгоднее остановиться раньше,
+    # чем просматривать всю таблицу параллельно
+    parallel = limit is None and not lazy
+    records = iter_select(
+        table_data, metadata, table_name, where_clause, indexes, parallel
+    )
+    stop = None if limit is None else offset + limit
+    records = islice(records, offset, stop)
+    if columns:
+        columns = _resolve_columns(metadata, table_name, columns)
+        records = (
+            {column: record.get(column) for column in columns}
+            for record in records
+        )
+    if lazy:
+        return records
+    with timed("scan"):
+        records = list(records)
+    increment("rows.selected", len(records))
+    return records
+
+
+def _aggregate_from_stats(table_data, items, indexes):
+    """Вычисляет агрегаты без обхода записей, если это возможно.
+
+    count(*) берется из длины таблицы, min/max по ID - из крайних записей,
+    а min/max по индексированному столбцу - из отсортированного индекса.
+    Возвращает None, если хотя бы один агрегат требует обхода.
+    """
+    row = {}
+    for item in items:
+        if isinstance(item, str):
+            return None
+        function, column = item
+        if function == "count" and column == "*":
+            row[item_label(item)] = len(table_data)
+        elif function in ("min", "max") and column == "ID":
+            edge = 0 if function == "min" else -1
+            row[item_label(item)] = table_data[edge]["ID"] if table_data else None
+        elif function in ("min", "max") and column in indexes:
+            pairs = indexes[column]["sorted"]
+            edge = 0 if function == "min" else -1
+            row[item_label(item)] = pairs[edge][0] if pairs else None
+        else:
+            return None
+    return [row]
 
-    col_type = get_column_type(metadata, table_name, where_key)
-    if not col_type:
-        return []
 
-    where_value = _cast_value(where_value_str, col_type)
+@handle_db_errors
+@log_time
+def aggregate(
+    table_data,
+    metadata,
+    table_name,
+    items,
+    where_clause=None,
+    group_by=None,
+    indexes=None,
+):
+    """Вычисляет агрегатные функции, при необходимости по группам.
+
+    Все агрегаты считаются за один проход по записям, удовлетворяющим
+    условию. Столбцы без функции допускаются только из group by.
+    """
+    if not items:
+        raise ValueError("Не указаны столбцы или агрегатные функции.")
+    group_by = _resolve_columns(metadata, table_name, group_by or [])
+    resolved_items = []
+    for item in items:
+        if isinstance(item, str):
+            (column,) = _resolve_columns(metadata, table_name, [item])
+            if column not in group_by:
+                raise ValueError(
+                    f'Столбец "{item}" должен быть в group by или в агрегате.'
+                )
+            resolved_items.append(column)
+            continue
+
+        function, column = item
+        if column != "*":
+            (column,) = _resolve_columns(metadata, table_name, [column])
+            col_type = get_column_type(metadata, table_name, column)
+            if function in ("sum", "avg") and col_type not in ("int", "bool"):
+                raise ValueError(
+                    f'Функция "{function}" применима только к числовым столбцам.'
+                )
+        resolved_items.append((function, column))
+
+    if where_clause is None and not group_by:
+        rows = _aggregate_from_stats(table_data, resolved_items, indexes or {})
+        if rows is not None:
+            return rows
+
+    aggregates = [item for item in resolved_items if not isinstance(item, str)]
+    where = _bind_where(where_clause, metadata, table_name)
+    with timed("scan"):
+        if _scan_in_parallel(table_data, where, indexes):
+            groups = parallel_aggregate(table_data, where, aggregates, group_by)
+        else:
+            records = iter_where(table_data, where, indexes)
+            groups = aggregate_records(records, aggregates, group_by)
+    return finalize_groups(groups, resolved_items, group_by)
+
+
+def _join_resolver(metadata, table_names):
+    """Возвращает функцию: столбец соединения -> ("таблица.столбец", тип).
+
+    Столбец указывается как <таблица>.<столбец> или только по имени,
+    если оно есть лишь в одной из таблиц.
+    """
+    def resolve(column):
+        table_name, dot, name = column.partition(".")
+        if dot:
+            if table_name not in table_names:
+                raise ValueError(f'Таблица "{table_name}" не участвует в запросе.')
+            candidates = [table_name]
+        else:
+            name = column
+            candidates = [
+                table for table in table_names
+                if get_column_type(metadata, table, name)
+            ]
+            if len(candidates) > 1:
+                raise ValueError(
+                    f'Столбец "{column}" есть в обеих таблицах, '
+                    "укажите <таблица>.<столбец>."
+                )
+        col_type = candidates and get_column_type(metadata, candidates[0], name)
+        if not col_type:
+            raise ValueError(f'Столбец "{column}" не существует.')
+        name = "ID" if name.upper() == "ID" else name
+        return f"{candidates[0]}.{name}", col_type
+    return resolve
+
+
+def _join_lookup(table_data, indexes, column, where):
+    """Возвращает поиск записей по значению столбца соединения через индекс.
+
+    Для столбца без индекса возвращает None. Если на таблицу наложено
+    условие, найденные записи дополнительно проверяются по нему.
+    """
+    if column == "ID":
+        def lookup(value):
+            # bool - подкласс int, но с ID не сравнивается
+            if type(value) is not int:
+                return []
+            return records_by_ids(table_data, [value])
+    elif column in indexes:
+        def lookup(value):
+            return records_by_ids(table_data, index_lookup(indexes[column], value))
+    else:
+        return None
+    if where is None:
+        return lookup
+    predicate = compile_predicate(where)
+    return lambda value: filter(predicate, lookup(value))
 
-    for record in table_data:
-        if where_key in record and record[where_key] == where_value:
-            results.append(record)
 
-    return results
+def _conjunction(nodes):
+    """Объединяет условия через and; для пустого списка возвращает None."""
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
+
+
+def _split_join_where(where, qualified):
+    """Делит условие соединения на условия отдельных таблиц и остаток.
+
+    Возвращает ({таблица: условие со столбцами таблицы}, остаток), где
+    остаток - условие на столбцы обеих таблиц, проверяемое после соединения.
+    """
+    side_nodes = {}
+    residual = []
+    nodes = () if where is None else where[1] if where[0] == "and" else (where,)
+    for node in nodes:
+        columns = where_columns(node)
+        tables = {qualified[column][0] for column in columns}
+        if len(tables) == 1:
+            names = {column: qualified[column][1] for column in columns}
+            side_nodes.setdefault(tables.pop(), []).append(
+                rename_columns(node, names)
+            )
+        else:
+            residual.append(node)
+    side_where = {
+        table: _conjunction(nodes) for table, nodes in side_nodes.items()
+    }
+    return side_where, _conjunction(residual)
+
+
+def _join_pairs(left, right, max_build_rows):
+    """Возвращает итератор пар (левая запись, правая запись).
+
+    left и right - четверки (данные, индексы, столбец соединения, условие).
+    """
+    left_data, left_indexes, left_column, left_where = left
+    right_data, right_indexes, right_column, right_where = right
+    left_key, right_key = column_getter(left_column), column_getter(right_column)
+    left_lookup = _join_lookup(left_data, left_indexes, left_column, left_where)
+    right_lookup = _join_lookup(right_data, right_indexes, right_column, right_where)
+    left_records = iter_where(left_data, left_where, left_indexes)
+    right_records = iter_where(right_data, right_where, right_indexes)
+
+    # С индексом с обеих сторон просматривается меньшая таблица
+    if right_lookup and (not left_lookup or len(left_data) <= len(right_data)):
+        pairs = index_join(left_records, left_key, right_lookup)
+        return ((left_record, match) for match, left_record in pairs)
+    if left_lookup:
+        return index_join(right_records, right_key, left_lookup)
+
+    # Хеш-таблица строится по меньшей таблице, а записи другой читаются
+    # потоком и в памяти целиком не собираются
+    if len(left_data) <= len(right_data):
+        return hash_join(
+            list(left_records), right_records, left_key, right_key, max_build_rows
+        )
+    pairs = hash_join(
+        list(right_records), left_records, right_key, left_key, max_build_rows
+    )
+    return ((left_record, match) for match, left_record in pairs)
 
 
 @handle_db_errors
-def update(table_data, metadata, table_name, set_clause, where_clause):
+@log_time
+def join_select(
+    metadata,
+    left,
+    right,
+    on,
+    where_clause=None,
+    limit=None,
+    offset=0,
+    columns=None,
+    max_build_rows=JOIN_BUILD_MAX_ROWS,
+):
+    """Выбирает пары записей двух таблиц с равными значениями столбцов on.
+
+    left и right - тройки (имя таблицы, данные, индексы). Части условия,
+    касающиеся одной таблицы, применяются к ней до соединения. Если по
+    столбцу соединения одной из таблиц есть индекс (или это ID), другая
+    таблица просматривается, а пары ищутся через индекс; иначе по меньшей
+    стороне строится хеш-таблица. Записи результата - словари со
+    столбцами вида <таблица>.<столбец>.
+    """
+    left_table, left_data, left_indexes = left
+    right_table, right_data, right_indexes = right
+    if left_table == right_table:
+        raise ValueError("Соединение таблицы с самой собой не поддерживается.")
+    resolve = _join_resolver(metadata, (left_table, right_table))
+    # "таблица.столбец" -> (таблица, столбец)
+    qualified = {
+        f"{table}.{name}": (table, name)
+        for table in (left_table, right_table)
+        for name in get_schema(metadata, table).names
+    }
+
+    (left_on, left_type), (right_on, right_type) = map(resolve, on)
+    if qualified[left_on][0] == qualified[right_on][0]:
+        raise ValueError("Столбцы соединения должны быть из разных таблиц.")
+    if left_type != right_type:
+        raise ValueError("Столбцы соединения должны быть одного типа.")
+    if qualified[left_on][0] != left_table:
+        left_on, right_on = right_on, left_on
+
+    where = None
+    if where_clause is not None:
+        with timed("cast"):
+            where = _bind_node(where_clause, resolve)
+    side_where, residual = _split_join_where(where, qualified)
+
+    pairs = _join_pairs(
+        (
+            left_data,
+            left_indexes or {},
+            qualified[left_on][1],
+            side_where.get(left_table),
+        ),
+        (
+            right_data,
+            right_indexes or {},
+            qualified[right_on][1],
+            side_where.get(right_table),
+        ),
+        max_build_rows,
+    )
+    left_names = [
+        (column, name)
+        for column, (table, name) in qualified.items()
+        if table == left_table
+    ]
+    right_names = [
+        (column, name)
+        for column, (table, name) in qualified.items()
+        if table == right_table
+    ]
+    records = (
+        {
+            **{column: left_record.get(name) for column, name in left_names},
+            **{column: right_record.get(name) for column, name in right_names},
+        }
+        for left_record, right_record in pairs
+    )
+    if residual is not None:
+        records = filter(compile_predicate(residual), records)
+    stop = None if limit is None else offset + limit
+    records = islice(records, offset, stop)
+    if columns:
+        columns = [resolve(column)[0] for column in columns]
+        records = (
+            {column: record[column] for column in columns} for record in records
+        )
+    with timed("scan"):
+        records = list(records)
+    increment("rows.selected", len(records))
+    return records
+
+
+@handle_db_errors
+@log_time
+def update(
+    table_data, metadata, table_name, set_clause, where_clause, indexes=None
+):
     """Обновляет записи в таблице."""
-    updated_ids = []
-    where_key, where_value_str = list(where_clause.items())[0]
     set_key, set_value_str = list(set_clause.items())[0]
-
-    where_col_type = get_column_type(metadata, table_name, where_key)
+    if set_key.upper() == "ID":
+        # Поиск записей по ID опирается на возрастающий порядок ID
+        return False, "Столбец ID нельзя изменять.", table_data, None
     set_col_type = get_column_type(metadata, table_name, set_key)
 
-    if not where_col_type or not set_col_type:
-        return False, "Один из столбцов в условии не найден.", table_data
+    try:
+        where = _bind_where(where_clause, metadata, table_name)
+    except ValueError:
+        where = None
+    if not where or not set_col_type:
+        return False, "Один из столбцов в условии не найден.", table_data, None
 
-    where_value = _cast_value(where_value_str, where_col_type)
     set_value = _cast_value(set_value_str, set_col_type)
 
     if set_value is None:
@@ -171,52 +788,61 @@ def update(table_data, metadata, table_name, set_clause, where_clause):
                 set_value_str, set_col_type
             ),
             table_data,
+            None,
         )
 
-    for record in table_data:
-        if where_key in record and record[where_key] == where_value:
-            record[set_key] = set_value
-            updated_ids.append(record["ID"])
+    with timed("scan"):
+        updated_ids = [
+            record["ID"] for record in iter_where(table_data, where, indexes)
+        ]
 
     if updated_ids:
         ids_str = ", ".join(map(str, updated_ids))
+        change = {"op": "update", "ids": updated_ids, "set": {set_key: set_value}}
+        apply_change(table_data, change, indexes)
+        increment("rows.updated", len(updated_ids))
         return (
             True,
             f'Запись(и) с ID {ids_str} в таблице "{table_name}" успешно обновлена.',
             table_data,
+            change,
         )
 
-    return False, "Не найдено записей для обновления.", table_data
+    return False, "Не найдено записей для обновления.", table_data, None
 
 
 @handle_db_errors
 @confirm_action("удаление записей")
-def delete(table_data, metadata, table_name, where_clause):
+@log_time
+def delete(table_data, metadata, table_name, where_clause, indexes=None):
     """Удаляет записи из таблицы."""
-    where_key, where_value_str = list(where_clause.items())[0]
-    where_col_type = get_column_type(metadata, table_name, where_key)
-
-    if not where_col_type:
-        return False, "Столбец в условии не найден.", table_data
-
-    where_value = _cast_value(where_value_str, where_col_type)
+    try:
+        where = _bind_where(where_clause, metadata, table_name)
+    except ValueError:
+        where = None
+    if not where:
+        return False, "Столбец в условии не найден.", table_data, None
 
-    ids_to_delete = {
-        record["ID"]
-        for record in table_data
-        if where_key in record and record[where_key] == where_value
-    }
+    with timed("scan"):
+        ids_to_delete = {
+            record["ID"] for record in iter_where(table_data, where, indexes)
+        }
 
     if not ids_to_delete:
-        return False, "Не найдено записей для удаления.", table_data
+        return False, "Не найдено записей для удаления.", table_data, None
 
-    new_table_data = [
-        record for record in table_data if record["ID"] not in ids_to_delete
-    ]
+    change = {"op": "delete", "ids": sorted(ids_to_delete)}
+    apply_change(table_data, change, indexes)
+    increment("rows.deleted", len(ids_to_delete))
 
     deleted_count = len(ids_to_delete)
     id_str = "запись"
     if deleted_count > 1:
         id_str = "записи"
 
-    return True, f"{deleted_count} {id_str} успешно удалено.", new_table_data
\ No newline at end of file
+    return (
+        True,
+        f"{deleted_count} {id_str} успешно удалено.",
+        table_data,
+        change,
+    )
\ No newline at end of file
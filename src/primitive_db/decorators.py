@@ -1,6 +1,34 @@
-import time
+from collections import OrderedDict
 from functools import wraps
 
+from .constants import CACHE_MAX_ENTRIES, CACHE_MAX_ROWS
+from .metrics import timed
+
+# Настройки декораторов: автоподтверждение действий, тихий режим и
+# диалоговый режим, в котором можно задавать вопросы пользователю
+_settings = {"auto_confirm": False, "quiet": False, "interactive": True}
+
+
+def configure(auto_confirm=None, quiet=None, interactive=None):
+    """Меняет настройки декораторов для текущего процесса."""
+    if auto_confirm is not None:
+        _settings["auto_confirm"] = auto_confirm
+    if quiet is not None:
+        _settings["quiet"] = quiet
+    if interactive is not None:
+        _settings["interactive"] = interactive
+
+
+def is_interactive():
+    """Проверяет, можно ли спрашивать пользователя через input()."""
+    return _settings["interactive"]
+
+
+def _notice(message):
+    """Печатает служебное сообщение, если не включен тихий режим."""
+    if not _settings["quiet"]:
+        print(message)
+
 
 def handle_db_errors(func):
     """Декоратор для обработки ошибок базы данных."""
@@ -27,6 +55,16 @@ def confirm_action(action_name):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            if _settings["auto_confirm"]:
+                return func(*args, **kwargs)
+            if not _settings["interactive"]:
+                # Ответ нельзя читать из потока команд: он проглотил бы
+                # следующую команду
+                print(
+                    "Операция отменена: в пакетном режиме подтвердите ее "
+                    "параметром --yes."
+                )
+                return None
             try:
                 prompt_message = (
                     f'Вы уверены, что хотите выполнить "{action_name}"? [y/n]: '
@@ -45,37 +83,75 @@ def confirm_action(action_name):
 
 
 def log_time(func):
-    """Декоратор для замера времени выполнения функции."""
+    """Декоратор для замера времени выполнения функции.
+
+    Время попадает в гистограмму core.<имя функции> (команда stats).
+    """
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.monotonic()
-        result = func(*args, **kwargs)
-        end_time = time.monotonic()
-        print(
-            f"Функция {func.__name__} выполнилась "
-            f"за {end_time - start_time:.3f} секунд."
-        )
-        return result
+        with timed(f"core.{func.__name__}"):
+            return func(*args, **kwargs)
     return wrapper
 
 
-def create_cacher():
-    """Создает функцию с замыканием для кэширования."""
-    cache = {}
+def create_cacher(max_entries=CACHE_MAX_ENTRIES, max_rows=CACHE_MAX_ROWS):
+    """Создает функции с замыканием для кэширования.
+
+    Ключ кэша - пара (имя таблицы, условие). Кэш ограничен числом записей
+    и суммарным числом строк в результатах, при переполнении вытесняются
+    давно не использованные результаты. Размер результата запоминается
+    вместе с ним: результат может быть самой таблицей, которая потом
+    меняется.
+    """
+    cache = OrderedDict()
+    stats = {"hits": 0, "misses": 0, "evictions": 0, "rows": 0}
+
+    def _size(result):
+        return len(result) if result is not None else 0
+
+    def _evict_oldest():
+        _, (_, size) = cache.popitem(last=False)
+        stats["rows"] -= size
+        stats["evictions"] += 1
 
     def cache_result(key, value_func):
         """Кэширует результат выполнения функции."""
         if key in cache:
-            print("(из кэша)")
-            return cache[key]
-        
+            cache.move_to_end(key)
+            stats["hits"] += 1
+            _notice("(из кэша)")
+            return cache[key][0]
+
+        stats["misses"] += 1
         result = value_func()
-        cache[key] = result
+        size = _size(result)
+        if size > max_rows:
+            return result
+
+        cache[key] = (result, size)
+        stats["rows"] += size
+        while len(cache) > max_entries or stats["rows"] > max_rows:
+            _evict_oldest()
         return result
 
-    def clear_cache():
-        """Очищает кэш."""
-        cache.clear()
-        print("(кэш очищен)")
+    def clear_cache(table_name=None):
+        """Очищает кэш целиком или только результаты по одной таблице."""
+        if table_name is None:
+            cache.clear()
+            stats["rows"] = 0
+        else:
+            for key in [key for key in cache if key[0] == table_name]:
+                _, size = cache.pop(key)
+                stats["rows"] -= size
+        _notice("(кэш очищен)")
+
+    def get_stats():
+        """Возвращает счетчики попаданий, промахов и вытеснений."""
+        return {
+            "entries": len(cache),
+            "max_entries": max_entries,
+            "max_rows": max_rows,
+            **stats,
+        }
 
-    return cache_result, clear_cache
+    return cache_result, clear_cache, get_stats
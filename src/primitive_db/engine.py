@@ -1,28 +1,79 @@
+import os
 import re
 import shlex
-
-import prompt
-from prettytable import PrettyTable
-
-from .constants import ERROR_MESSAGES, HELP_MESSAGE
+import sys
+import time
+from itertools import islice
+
+from .buffer import BufferPool
+from .constants import (
+    DEFAULT_STORAGE,
+    ERROR_MESSAGES,
+    HELP_MESSAGE,
+    PAGE_SIZE,
+    PROFILE_TOP_FUNCTIONS,
+)
 from .core import (
+    aggregate,
+    create_index,
     create_table,
     delete,
     drop_table,
+    get_schema,
     insert,
+    insert_many,
+    join_select,
     list_tables,
     select,
+    set_table_storage,
     update,
 )
-from .decorators import create_cacher
+from .decorators import configure, create_cacher, is_interactive
+from .metrics import collect_phases, dump_json, reset, snapshot, timed, timed_function
+from .query import is_aggregate_query, parse_select, parse_where_clause
+from .storage import CorruptSnapshotError
+from .transfer import EXPORT_FORMATS, iter_import_rows, write_export_rows
 from .utils import (
     ensure_data_dir,
-    load_metadata,
-    load_table_data,
-    save_metadata,
-    save_table_data,
+    load_table_header,
+    recover_tables,
+    recover_transactions,
 )
 
+COMMANDS = {
+    "exit",
+    "help",
+    "begin",
+    "commit",
+    "rollback",
+    "create_table",
+    "drop_table",
+    "list_tables",
+    "insert",
+    "import",
+    "select",
+    "export",
+    "update",
+    "delete",
+    "info",
+    "create_index",
+    "cache_stats",
+    "migrate",
+    "stats",
+    "explain",
+    "profile",
+    "checkpoint",
+}
+
+# Команды, меняющие схему или файлы таблицы целиком, недоступны в транзакции
+NON_TRANSACTIONAL_COMMANDS = {
+    "create_table",
+    "drop_table",
+    "create_index",
+    "migrate",
+    "checkpoint",
+}
+
 
 def parse_clause(parts, keyword):
     """Парсит условие."""
@@ -46,221 +97,806 @@ def parse_clause(parts, keyword):
         return None
 
 
+@timed_function("render")
+def print_records(records, field_names):
+    """Печатает записи таблицей."""
+    # prettytable нужен только при выводе таблиц: импорт не замедляет запуск
+    from prettytable import PrettyTable
+
+    table = PrettyTable(field_names=field_names)
+    for row in records:
+        table.add_row([row.get(field) for field in field_names])
+    print(table)
+
+
+def print_stats(metrics):
+    """Печатает счетчики и гистограммы задержек."""
+    from prettytable import PrettyTable
+
+    for name, value in metrics["counters"].items():
+        print(f"{name}: {value}")
+    table = PrettyTable(
+        field_names=[
+            "Операция",
+            "Вызовов",
+            "Среднее, мс",
+            "p50, мс",
+            "p95, мс",
+            "Макс., мс",
+        ]
+    )
+    for name, histogram in metrics["histograms"].items():
+        table.add_row(
+            [
+                name,
+                histogram["count"],
+                f"{histogram['mean_ms']:.3f}",
+                f"{histogram['p50_ms']:.3f}",
+                f"{histogram['p95_ms']:.3f}",
+                f"{histogram['max_ms']:.3f}",
+            ]
+        )
+    print(table)
+
+
+def print_phases(phases, elapsed, peak):
+    """Печатает время команды по фазам (фазы могут быть вложены)."""
+    from prettytable import PrettyTable
+
+    totals = {}
+    for name, seconds in phases:
+        calls, total = totals.get(name, (0, 0.0))
+        totals[name] = (calls + 1, total + seconds)
+    table = PrettyTable(field_names=["Фаза", "Вызовов", "Время, мс"])
+    for name, (calls, total) in totals.items():
+        table.add_row([name, calls, f"{total * 1000:.3f}"])
+    print(table)
+    print(f"Всего: {elapsed * 1000:.3f} мс")
+    print(f"Пиковая память: {peak / 1024:.0f} КиБ")
+
+
+@timed_function("render")
+def print_paged(records, field_names, page_size=PAGE_SIZE):
+    """Печатает записи постранично, запрашивая продолжение.
+
+    Вне диалогового режима страницы печатаются подряд, без вопросов.
+    """
+    records = iter(records)
+    page = list(islice(records, page_size))
+    if not page:
+        print("Нет записей, удовлетворяющих условию.")
+        return
+
+    while page:
+        print_records(page, field_names)
+        page = list(islice(records, page_size))
+        if (
+            page
+            and is_interactive()
+            and input("Показать следующую страницу? [y/n]: ").lower() != "y"
+        ):
+            break
+
+
+@timed_function("parse")
 def parse_values(original_command):
-    """Извлекает значения из команды INSERT."""
-    match = re.search(r"values\s*\((.*)\)", original_command, re.IGNORECASE)
+    """Извлекает кортежи значений из команды INSERT.
+
+    Возвращает список строк, каждая - список значений в исходном виде.
+    Запятые и скобки внутри кавычек считаются частью значения.
+    """
+    match = re.search(
+        r"values\s*(\(.*\))\s*$", original_command, re.IGNORECASE | re.DOTALL
+    )
     if not match:
         return None
-    
-    values_str = match.group(1)
-    # Простое разделение по запятой с очисткой пробелов
-    return [v.strip() for v in values_str.split(',')]
 
+    rows, row, value = [], None, ""
+    quote = None
+    # Была ли запятая после последнего закрытого кортежа
+    separated = False
+    for char in match.group(1):
+        if quote:
+            value += char
+            if char == quote:
+                quote = None
+        elif row is None:
+            # Между кортежами допустимы ровно одна запятая и пробелы
+            if char == "(":
+                if rows and not separated:
+                    return None
+                row, value, separated = [], "", False
+            elif char == "," and not separated:
+                separated = True
+            elif char not in " \t\n":
+                return None
+        elif char in "'\"":
+            quote = char
+            value += char
+        elif char == ",":
+            row.append(value.strip())
+            value = ""
+        elif char == ")":
+            row.append(value.strip())
+            rows.append(row)
+            row = None
+        else:
+            value += char
+
+    if quote or row is not None:
+        return None
+    return rows
+
+
+def create_session():
+    """Создает состояние сеанса: пул таблиц и кэш select.
+
+    Перед этим таблицы с признаками сбоя приводятся к последней
+    контрольной точке и дописываются изменения транзакций, фиксация
+    которых была прервана.
+    """
+    for table_name in recover_tables():
+        print(f'Таблица "{table_name}" восстановлена после сбоя.')
+    recover_transactions()
+    select_cacher, clear_select_cache, get_cache_stats = create_cacher()
+    return {
+        "pool": BufferPool(),
+        "select_cacher": select_cacher,
+        "clear_select_cache": clear_select_cache,
+        "get_cache_stats": get_cache_stats,
+    }
+
+
+def execute(original_command_str, session):
+    """Выполняет одну команду.
+
+    Возвращает False, если после команды нужно завершить работу.
+    """
+    words = original_command_str.split(maxsplit=1)
+    name = words[0].lower() if words else None
+    try:
+        if name not in COMMANDS:
+            return _execute_command(original_command_str, session)
+        with timed(f"command.{name}"):
+            return _execute_command(original_command_str, session)
+    except TimeoutError:
+        print(
+            "Ошибка: Таблица занята транзакцией другого процесса. "
+            "Повторите команду позже."
+        )
+        return True
+    except CorruptSnapshotError as e:
+        print(f"Ошибка: {e}")
+        return True
+
+
+def _execute_command(original_command_str, session):
+    """Разбирает и выполняет одну команду."""
+    pool = session["pool"]
+    select_cacher = session["select_cacher"]
+    clear_select_cache = session["clear_select_cache"]
+    get_cache_stats = session["get_cache_stats"]
+
+    original_command_str = original_command_str.strip()
+    if not original_command_str:
+        return True
 
-def run():
-    """Основной цикл программы."""
-    ensure_data_dir()
-    print("***Примитивная база данных***")
-    print(HELP_MESSAGE)
-
-    select_cacher, clear_select_cache = create_cacher()
+    try:
+        with timed("parse"):
+            parts = shlex.split(original_command_str)
+    except ValueError as e:
+        print(f"Ошибка: Неверный синтаксис команды: {e}")
+        return True
+    command = parts[0].lower()
+    args = parts[1:]
+
+    metadata = pool.get_metadata()
+
+    if pool.in_transaction() and command in NON_TRANSACTIONAL_COMMANDS:
+        print(f'Ошибка: Команда "{command}" недоступна внутри транзакции.')
+        return True
+
+    if command == "exit":
+        if pool.in_transaction():
+            for table_name in pool.rollback():
+                clear_select_cache(table_name)
+            print("Незавершенная транзакция отменена.")
+        pool.flush()
+        print("Выход из программы.")
+        return False
+
+    elif command == "begin":
+        if pool.in_transaction():
+            print("Ошибка: Транзакция уже начата.")
+            return True
+        pool.begin()
+        print("Транзакция начата.")
+
+    elif command == "commit":
+        if not pool.in_transaction():
+            print("Ошибка: Нет активной транзакции.")
+            return True
+        count = pool.commit()
+        print(f"Транзакция зафиксирована. Изменений: {count}.")
+
+    elif command == "rollback":
+        if not pool.in_transaction():
+            print("Ошибка: Нет активной транзакции.")
+            return True
+        for table_name in pool.rollback():
+            clear_select_cache(table_name)
+        print("Транзакция отменена.")
+
+    elif command == "help":
+        print(HELP_MESSAGE)
+
+    elif command == "create_table":
+        if len(args) < 2:
+            print(
+                "Ошибка: Недостаточно аргументов. "
+                "Используйте: create_table <имя> <столбец1:тип> ..."
+            )
+            return True
+        table_name, columns = args[0], args[1:]
+        with pool.lock_metadata():
+            metadata = pool.get_metadata()
+            success, message = create_table(metadata, table_name, columns)
+            print(message)
+            if success:
+                pool.save_metadata(metadata)
+                clear_select_cache(table_name)
+
+    elif command == "drop_table":
+        if len(args) != 1:
+            print(
+                "Ошибка: Неверное количество аргументов. "
+                "Используйте: drop_table <имя_таблицы>"
+            )
+            return True
+        table_name = args[0]
+        with pool.lock_metadata():
+            metadata = pool.get_metadata()
+            result = drop_table(metadata, table_name)
+            if result:
+                success, message = result
+                print(message)
+                if success:
+                    pool.save_metadata(metadata)
+                    pool.drop_table(table_name)
+                    clear_select_cache(table_name)
 
-    while True:
-        original_command_str = prompt.string("Введите команду: ").strip()
-        if not original_command_str:
-            continue
+    elif command == "list_tables":
+        print(list_tables(metadata))
 
+    elif command == "insert":
         try:
-            parts = shlex.split(original_command_str)
-            command = parts[0].lower()
-            args = parts[1:]
-
-            metadata = load_metadata()
+            into_index = parts.index("into")
+            parts.index("values") # Проверяем, что values есть в команде
+            table_name = parts[into_index + 1]
+        except (ValueError, IndexError):
+            print(
+                "Ошибка: Неверный синтаксис. "
+                "Используйте: insert into <имя_таблицы> values (...)"
+            )
+            return True
+
+        values = parse_values(original_command_str)
+        if values is None:
+            print(
+                "Ошибка: Неверный синтаксис для values. "
+                "Убедитесь, что значения в скобках ()."
+            )
+            return True
+
+        if table_name not in metadata:
+            # Проверка до блокировки: иначе для неверного имени остался бы
+            # файл блокировки
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+        with pool.lock_table(table_name):
+            table_data, indexes, header = pool.get_table(
+                table_name, writable=True
+            )
+            if len(values) == 1:
+                result = insert(
+                    metadata, table_data, table_name, values[0], indexes, header
+                )
+            else:
+                result = insert_many(
+                    metadata, table_data, table_name, values, indexes, header
+                )
+            if result:
+                success, message, _, change = result
+                print(message)
+                if success:
+                    pool.save_change(table_name, change)
+                    clear_select_cache(table_name)
+
+    elif command == "import":
+        if len(args) != 2:
+            print(
+                "Ошибка: Неверное количество аргументов. "
+                "Используйте: import <имя_таблицы> <файл.csv|файл.jsonl>"
+            )
+            return True
+        table_name, filepath = args
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+
+        column_names = get_schema(metadata, table_name).names[1:]
+        if not os.path.isfile(filepath):
+            print(f'Ошибка: Файл "{filepath}" не найден.')
+            return True
+
+        with pool.lock_table(table_name):
+            table_data, indexes, header = pool.get_table(
+                table_name, writable=True
+            )
+            result = insert_many(
+                metadata,
+                table_data,
+                table_name,
+                iter_import_rows(filepath, column_names),
+                indexes,
+                header,
+            )
+            if result:
+                success, message, _, change = result
+                print(message)
+                if success:
+                    if pool.in_transaction():
+                        pool.save_change(table_name, change)
+                    else:
+                        # Весь импорт фиксируется одной контрольной точкой
+                        # без записи в журнал
+                        pool.save_table(table_name, logged=False)
+                    clear_select_cache(table_name)
+
+    elif command == "select":
+        try:
+            query = parse_select(original_command_str)
+        except ValueError as e:
+            print(f"Ошибка: Неверный синтаксис. {e}")
+            print(
+                "Используйте: select [<столбец>, ...] from <имя_таблицы> "
+                "[join <таблица> on <столбец> = <столбец>] "
+                "[where ...] [group by ...] [limit N] [offset M] [paged]"
+            )
+            return True
+
+        table_name = query["table"]
+        where_clause = query["where"]
+        limit, offset = query["limit"], query["offset"]
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+        if pool.table_changed(table_name):
+            # Таблицу мог изменить другой процесс
+            clear_select_cache(table_name)
+
+        if query["join"] is not None:
+            join_table = query["join"]["table"]
+            if join_table not in metadata:
+                print(ERROR_MESSAGES["table_not_exists"].format(join_table))
+                return True
+            if is_aggregate_query(query):
+                print(
+                    "Ошибка: Агрегатные функции и group by не поддерживаются "
+                    "в запросах с join."
+                )
+                return True
+            table_data, indexes, _ = pool.get_table(table_name)
+            join_data, join_indexes, _ = pool.get_table(join_table)
+            results = join_select(
+                metadata,
+                (table_name, table_data, indexes),
+                (join_table, join_data, join_indexes),
+                query["join"]["on"],
+                where_clause,
+                limit,
+                offset,
+                query["columns"],
+            )
+            if results is None:
+                return True
+            if not results:
+                print("Нет записей, удовлетворяющих условию.")
+            elif query["paged"]:
+                print_paged(results, list(results[0]))
+            else:
+                print_records(results, list(results[0]))
+            return True
+
+        if is_aggregate_query(query):
+            cache_key = (
+                table_name,
+                str(where_clause),
+                str(query["columns"]),
+                str(query["group_by"]),
+            )
+
+            def db_aggregate():
+                table_data, indexes, _ = pool.get_table(table_name)
+                return aggregate(
+                    table_data,
+                    metadata,
+                    table_name,
+                    query["columns"] or [],
+                    where_clause,
+                    query["group_by"],
+                    indexes,
+                )
 
-            if command == "exit":
-                print("Выход из программы.")
-                break
+            results = select_cacher(cache_key, db_aggregate)
+            if results is None:
+                return True
+            stop = None if limit is None else offset + limit
+            results = results[offset:stop]
+            if not results:
+                print("Нет записей, удовлетворяющих условию.")
+                return True
+            print_records(results, list(results[0]))
+            return True
+
+        field_names = query["columns"] or get_schema(metadata, table_name).names
+
+        if query["paged"]:
+            # Постраничный вывод читает записи по мере показа
+            table_data, indexes, _ = pool.get_table(table_name)
+            results = select(
+                table_data,
+                metadata,
+                table_name,
+                where_clause,
+                indexes,
+                limit,
+                offset,
+                query["columns"],
+                lazy=True,
+            )
+            if results is not None:
+                print_paged(results, field_names)
+            return True
+
+        cache_key = (
+            table_name,
+            str(where_clause),
+            str(query["columns"]),
+            limit,
+            offset,
+        )
+
+        def db_select():
+            table_data, indexes, _ = pool.get_table(table_name)
+            return select(
+                table_data,
+                metadata,
+                table_name,
+                where_clause,
+                indexes,
+                limit,
+                offset,
+                query["columns"],
+            )
+
+        results = select_cacher(cache_key, db_select)
+
+        if results is None:
+            return True
+
+        if not results:
+            print("Нет записей, удовлетворяющих условию.")
+            return True
+
+        print_records(results, field_names)
+
+    elif command == "export":
+        try:
+            table_name = args[0]
+            to_index = [part.lower() for part in parts].index("to")
+            filepath = parts[to_index + 1]
+        except (ValueError, IndexError):
+            print(
+                "Ошибка: Неверный синтаксис. Используйте: export "
+                "<имя_таблицы> [where ...] to <файл> as csv|jsonl"
+            )
+            return True
+
+        export_format = os.path.splitext(filepath)[1].lstrip(".").lower()
+        lowered = [part.lower() for part in parts]
+        if "as" in lowered and lowered.index("as") + 1 < len(parts):
+            export_format = lowered[lowered.index("as") + 1]
+        if export_format not in EXPORT_FORMATS:
+            print(
+                f'Ошибка: Неподдерживаемый формат "{export_format}". '
+                "Поддерживаемые форматы: csv, jsonl."
+            )
+            return True
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
 
-            elif command == "help":
-                print(HELP_MESSAGE)
-
-            elif command == "create_table":
-                if len(args) < 2:
-                    print(
-                        "Ошибка: Недостаточно аргументов. "
-                        "Используйте: create_table <имя> <столбец1:тип> ..."
-                    )
-                    continue
-                table_name, columns = args[0], args[1:]
-                success, message = create_table(metadata, table_name, columns)
+        try:
+            where_clause = parse_where_clause(original_command_str)
+        except ValueError as e:
+            print(f"Ошибка: Неверный синтаксис для WHERE. {e}")
+            return True
+
+        table_data, indexes, _ = pool.get_table(table_name)
+        records = select(
+            table_data, metadata, table_name, where_clause, indexes, lazy=True
+        )
+        if records is None:
+            return True
+        field_names = get_schema(metadata, table_name).names
+        count = write_export_rows(records, filepath, field_names, export_format)
+        print(f'Экспортировано записей: {count} в файл "{filepath}".')
+
+    elif command == "update":
+        try:
+            table_name = parts[1]
+            if "set" not in parts or "where" not in parts:
+                raise ValueError
+        except (ValueError, IndexError):
+            print(
+                "Ошибка: Неверный синтаксис. "
+                "Используйте: update <имя_таблицы> set ... where ..."
+            )
+            return True
+
+        set_clause = parse_clause(parts, "set")
+        try:
+            where_clause = parse_where_clause(original_command_str)
+        except ValueError:
+            where_clause = None
+
+        if not set_clause or not where_clause:
+            print("Ошибка: Неверный синтаксис для SET или WHERE.")
+            return True
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+
+        with pool.lock_table(table_name):
+            table_data, indexes, _ = pool.get_table(table_name, writable=True)
+            result = update(
+                table_data,
+                metadata,
+                table_name,
+                set_clause,
+                where_clause,
+                indexes,
+            )
+            if result:
+                success, message, _, change = result
                 print(message)
                 if success:
-                    save_metadata(metadata)
-                    clear_select_cache()
-
-            elif command == "drop_table":
-                if len(args) != 1:
-                    print(
-                        "Ошибка: Неверное количество аргументов. "
-                        "Используйте: drop_table <имя_таблицы>"
-                    )
-                    continue
-                table_name = args[0]
-                result = drop_table(metadata, table_name)
-                if result:
-                    success, message = result
-                    print(message)
-                    if success:
-                        save_metadata(metadata)
-                        clear_select_cache()
-
-            elif command == "list_tables":
-                print(list_tables(metadata))
-
-            elif command == "insert":
-                try:
-                    into_index = parts.index("into")
-                    parts.index("values") # Проверяем, что values есть в команде
-                    table_name = parts[into_index + 1]
-                except (ValueError, IndexError):
-                    print(
-                        "Ошибка: Неверный синтаксис. "
-                        "Используйте: insert into <имя_таблицы> values (...)"
-                    )
-                    continue
-
-                values = parse_values(original_command_str)
-                if values is None:
-                    print(
-                        "Ошибка: Неверный синтаксис для values. "
-                        "Убедитесь, что значения в скобках ()."
-                    )
-                    continue
-
-                table_data = load_table_data(table_name)
-                success, message, new_data = insert(
-                    metadata, table_data, table_name, values
-                )
+                    pool.save_change(table_name, change)
+                    clear_select_cache(table_name)
+
+    elif command == "delete":
+        try:
+            from_index = parts.index("from")
+            table_name = parts[from_index + 1]
+            if "where" not in parts:
+                raise ValueError
+        except (ValueError, IndexError):
+            print(
+                "Ошибка: Неверный синтаксис. "
+                "Используйте: delete from <имя_таблицы> where ..."
+            )
+            return True
+
+        try:
+            where_clause = parse_where_clause(original_command_str)
+        except ValueError:
+            where_clause = None
+        if not where_clause:
+            print("Ошибка: Неверный синтаксис для WHERE.")
+            return True
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+
+        with pool.lock_table(table_name):
+            table_data, indexes, _ = pool.get_table(
+                table_name, writable=True
+            )
+            result = delete(
+                table_data, metadata, table_name, where_clause, indexes
+            )
+            if result:
+                success, message, _, change = result
                 print(message)
                 if success:
-                    save_table_data(table_name, new_data)
-                    clear_select_cache()
-
-            elif command == "select":
-                try:
-                    from_index = parts.index("from")
-                    table_name = parts[from_index + 1]
-                except (ValueError, IndexError):
-                    print(
-                        "Ошибка: Неверный синтаксис. "
-                        "Используйте: select from <имя_таблицы> ..."
-                    )
-                    continue
-
-                where_clause = parse_clause(parts, "where")
-
-                cache_key = f"{table_name}-{where_clause}"
-
-                def db_select():
-                    table_data = load_table_data(table_name)
-                    return select(table_data, metadata, table_name, where_clause)
-
-                results = select_cacher(cache_key, db_select)
-
-                if results is None:
-                    continue
-
-                if not results:
-                    print("Нет записей, удовлетворяющих условию.")
-                    continue
-
-                if table_name not in metadata:
-                    print(f"Ошибка: Не найдены метаданные для таблицы {table_name}")
-                    continue
-
-                field_names = [
-                    col.split(":")[0] for col in metadata[table_name]
-                ]
-                table = PrettyTable(field_names=field_names)
-                for row in results:
-                    table.add_row([row.get(field) for field in field_names])
-                print(table)
-
-            elif command == "update":
-                try:
-                    table_name = parts[1]
-                    if "set" not in parts or "where" not in parts:
-                        raise ValueError
-                except (ValueError, IndexError):
-                    print(
-                        "Ошибка: Неверный синтаксис. "
-                        "Используйте: update <имя_таблицы> set ... where ..."
-                    )
-                    continue
-
-                set_clause = parse_clause(parts, "set")
-                where_clause = parse_clause(parts, "where")
-
-                if not set_clause or not where_clause:
-                    print("Ошибка: Неверный синтаксис для SET или WHERE.")
-                    continue
-
-                table_data = load_table_data(table_name)
-                success, message, new_data = update(
-                    table_data, metadata, table_name, set_clause, where_clause
-                )
+                    pool.save_change(table_name, change)
+                    clear_select_cache(table_name)
+
+    elif command == "info":
+        if len(args) != 1:
+            print("Ошибка: Используйте: info <имя_таблицы>")
+            return True
+        table_name = args[0]
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+
+        columns = ", ".join(metadata[table_name])
+        header = load_table_header(table_name)
+        num_records = pool.count_rows(table_name)
+        storage = header.get("storage", DEFAULT_STORAGE)
+        print(f"Таблица: {table_name}")
+        print(f"Столбцы: {columns}")
+        print(f"Количество записей: {num_records}")
+        print(f"Формат хранения: {storage}")
+        if header.get("indexes"):
+            print(f"Индексы: {', '.join(header['indexes'])}")
+
+    elif command == "create_index":
+        if len(args) != 2:
+            print(
+                "Ошибка: Неверное количество аргументов. "
+                "Используйте: create_index <имя_таблицы> <столбец>"
+            )
+            return True
+        table_name, column = args
+        if table_name not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+            return True
+        with pool.lock_table(table_name):
+            table_data, indexes, _ = pool.get_table(
+                table_name, writable=True
+            )
+            result = create_index(
+                metadata, table_data, table_name, column, indexes
+            )
+            if result:
+                success, message = result
                 print(message)
                 if success:
-                    save_table_data(table_name, new_data)
-                    clear_select_cache()
-
-            elif command == "delete":
-                try:
-                    from_index = parts.index("from")
-                    table_name = parts[from_index + 1]
-                    if "where" not in parts:
-                        raise ValueError
-                except (ValueError, IndexError):
-                    print(
-                        "Ошибка: Неверный синтаксис. "
-                        "Используйте: delete from <имя_таблицы> where ..."
-                    )
-                    continue
-
-                where_clause = parse_clause(parts, "where")
-                if not where_clause:
-                    print("Ошибка: Неверный синтаксис для WHERE.")
-                    continue
-
-                table_data = load_table_data(table_name)
-                result = delete(
-                    table_data, metadata, table_name, where_clause
+                    pool.save_table(table_name)
+
+    elif command == "cache_stats":
+        stats = get_cache_stats()
+        print(f"Записей в кэше: {stats['entries']} из {stats['max_entries']}")
+        print(f"Строк в кэше: {stats['rows']} из {stats['max_rows']}")
+        print(f"Попадания: {stats['hits']}")
+        print(f"Промахи: {stats['misses']}")
+        print(f"Вытеснения: {stats['evictions']}")
+
+    elif command == "stats":
+        if not args:
+            print_stats(snapshot())
+        elif args[0].lower() == "json":
+            filepath = args[1] if len(args) > 1 else None
+            text = dump_json(filepath)
+            print(f'Метрики сохранены в "{filepath}".' if filepath else text)
+        elif args[0].lower() == "reset":
+            reset()
+            print("Метрики обнулены.")
+        else:
+            print("Ошибка: Используйте: stats [json [<файл>] | reset]")
+
+    elif command == "explain":
+        if len(args) < 2 or args[0].lower() != "analyze":
+            print("Ошибка: Используйте: explain analyze <команда>")
+            return True
+        import tracemalloc
+
+        inner_command = original_command_str.split(maxsplit=2)[2]
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        with collect_phases() as phases:
+            result = _execute_command(inner_command, session)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        if not tracing:
+            tracemalloc.stop()
+        print_phases(phases, elapsed, peak)
+        return result
+
+    elif command == "profile":
+        if not args:
+            print("Ошибка: Используйте: profile <команда>")
+            return True
+        import cProfile
+        import pstats
+
+        inner_command = original_command_str.split(maxsplit=1)[1]
+        profiler = cProfile.Profile()
+        result = profiler.runcall(_execute_command, inner_command, session)
+        stats = pstats.Stats(profiler, stream=sys.stdout)
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        return result
+
+    elif command == "migrate":
+        if len(args) != 2:
+            print(
+                "Ошибка: Неверное количество аргументов. "
+                "Используйте: migrate <имя_таблицы|*> <json|columnar>"
+            )
+            return True
+        target, storage = args
+        table_names = list(metadata) if target == "*" else [target]
+        for table_name in table_names:
+            if table_name not in metadata:
+                print(ERROR_MESSAGES["table_not_exists"].format(table_name))
+                continue
+            with pool.lock_table(table_name):
+                _, _, header = pool.get_table(table_name, writable=True)
+                result = set_table_storage(
+                    metadata, table_name, storage, header
                 )
                 if result:
-                    success, message, new_data = result
+                    success, message = result
                     print(message)
                     if success:
-                        save_table_data(table_name, new_data)
-                        clear_select_cache()
-
-            elif command == "info":
-                if len(args) != 1:
-                    print("Ошибка: Используйте: info <имя_таблицы>")
-                    continue
-                table_name = args[0]
-                if table_name not in metadata:
-                    print(ERROR_MESSAGES["table_not_exists"].format(table_name))
-                    continue
-
-                columns = ", ".join(metadata[table_name])
-                num_records = len(load_table_data(table_name))
-                print(f"Таблица: {table_name}")
-                print(f"Столбцы: {columns}")
-                print(f"Количество записей: {num_records}")
+                        pool.save_table(table_name)
 
-            else:
-                print(ERROR_MESSAGES["unknown_command"].format(command))
-                
+    elif command == "checkpoint":
+        if len(args) > 1:
+            print("Ошибка: Используйте: checkpoint [<имя_таблицы>]")
+            return True
+        if args and args[0] not in metadata:
+            print(ERROR_MESSAGES["table_not_exists"].format(args[0]))
+            return True
+        written = pool.checkpoint(args or sorted(metadata))
+        if written:
+            print(f"Контрольная точка записана: {', '.join(written)}.")
+        else:
+            print("Журналы пусты, контрольная точка не нужна.")
+
+    else:
+        print(ERROR_MESSAGES["unknown_command"].format(command))
+
+    return True
+
+
+def run():
+    """Основной цикл программы."""
+    import prompt
+
+    ensure_data_dir()
+    print("***Примитивная база данных***")
+    print(HELP_MESSAGE)
+
+    session = create_session()
+
+    while True:
+        try:
+            original_command_str = prompt.string("Введите команду: ")
+            if not execute(original_command_str, session):
+                break
         except KeyboardInterrupt:
+            session["pool"].flush()
             print("\nВыход из программы.")
             break
+
+
+def run_script(lines, auto_confirm=False):
+    """Выполняет команды из файла или потока без интерактивного ввода.
+
+    Пустые строки и строки, начинающиеся с "#" или "--", пропускаются.
+    Служебные сообщения о работе кэша не выводятся. Ответы на вопросы
+    из потока команд не читаются: без auto_confirm удаление отменяется,
+    а paged печатает все страницы.
+    """
+    ensure_data_dir()
+    configure(auto_confirm=auto_confirm, quiet=True, interactive=False)
+    session = create_session()
+
+    try:
+        for line in lines:
+            command_str = line.strip()
+            if not command_str or command_str.startswith(("#", "--")):
+                continue
+            if not execute(command_str, session):
+                return
+    except KeyboardInterrupt:
+        print("\nВыполнение прервано.")
+    session["pool"].flush()
+
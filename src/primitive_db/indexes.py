@@ -0,0 +1,142 @@
+"""Вторичные индексы таблиц: хеш-индекс и отсортированный индекс."""
+from bisect import bisect_left, bisect_right, insort
+
+from .rows import column_getter, delete_runs, position_runs
+
+_record_id = column_getter("ID")
+
+# Начиная с этого числа пар индекс дополняется одной сортировкой,
+# а не вставкой каждой пары по отдельности
+_BULK_INDEX_PAIRS = 64
+
+
+def new_index():
+    """Создает пустой индекс."""
+    return {"hash": {}, "sorted": []}
+
+
+def index_add(index, value, record_id):
+    """Добавляет значение записи в индекс."""
+    index["hash"].setdefault(value, set()).add(record_id)
+    insort(index["sorted"], (value, record_id))
+
+
+def index_add_many(index, entries):
+    """Добавляет в индекс пары (значение, ID) многих записей сразу."""
+    for value, record_id in entries:
+        index["hash"].setdefault(value, set()).add(record_id)
+    pairs = index["sorted"]
+    if len(entries) < _BULK_INDEX_PAIRS:
+        for pair in entries:
+            insort(pairs, pair)
+        return
+    # Сортировка сливает уже упорядоченный индекс с новыми парами
+    pairs.extend(sorted(entries))
+    pairs.sort()
+
+
+def index_remove(index, value, record_id):
+    """Удаляет значение записи из индекса."""
+    bucket = index["hash"].get(value)
+    if bucket is not None:
+        bucket.discard(record_id)
+        if not bucket:
+            del index["hash"][value]
+
+    pairs = index["sorted"]
+    position = bisect_left(pairs, (value, record_id))
+    if position < len(pairs) and pairs[position] == (value, record_id):
+        del pairs[position]
+
+
+def index_remove_many(index, entries):
+    """Удаляет из индекса пары (значение, ID) многих записей сразу."""
+    pairs = index["sorted"]
+    positions = []
+    for value, record_id in entries:
+        bucket = index["hash"].get(value)
+        if bucket is not None:
+            bucket.discard(record_id)
+            if not bucket:
+                del index["hash"][value]
+        position = bisect_left(pairs, (value, record_id))
+        if position < len(pairs) and pairs[position] == (value, record_id):
+            positions.append(position)
+    delete_runs(pairs, position_runs(sorted(positions)))
+
+
+def build_index(table_data, column):
+    """Строит индекс по столбцу таблицы."""
+    pairs = sorted(
+        (record[column], record["ID"]) for record in table_data if column in record
+    )
+    return load_index(pairs)
+
+
+def load_index(pairs):
+    """Восстанавливает индекс из отсортированных пар (значение, ID)."""
+    index = new_index()
+    for value, record_id in pairs:
+        index["hash"].setdefault(value, set()).add(record_id)
+    index["sorted"] = [tuple(pair) for pair in pairs]
+    return index
+
+
+def dump_index(index):
+    """Возвращает индекс в виде списка пар для сохранения в JSON."""
+    return [list(pair) for pair in index["sorted"]]
+
+
+def index_lookup(index, value):
+    """Возвращает отсортированные ID записей с заданным значением."""
+    return sorted(index["hash"].get(value, ()))
+
+
+def index_range(index, low=None, high=None):
+    """Возвращает ID записей со значениями в диапазоне [low, high]."""
+    pairs = index["sorted"]
+    start = 0 if low is None else bisect_left(pairs, (low,))
+    end = len(pairs)
+    if high is not None:
+        end = bisect_right(pairs, high, key=lambda pair: pair[0])
+    return sorted(record_id for _, record_id in pairs[start:end])
+
+
+def find_record_position(table_data, record_id, start=0):
+    """Ищет позицию записи по ID (записи упорядочены по возрастанию ID).
+
+    start - позиция, раньше которой записи с этим ID быть не может.
+    """
+    count = len(table_data)
+    if not count:
+        return None
+    # ID - возрастающие целые без повторов, поэтому запись стоит не дальше
+    # record_id - первый ID от начала и последний ID - record_id от конца;
+    # в таблице без удалений это сразу дает ее позицию
+    first_id = _record_id(table_data[0])
+    last_id = _record_id(table_data[-1])
+    low = max(start, count - 1 - (last_id - record_id))
+    high = min(count, record_id - first_id + 1)
+    if low >= high:
+        return None
+    position = bisect_left(table_data, record_id, low, high, key=_record_id)
+    if position < high and _record_id(table_data[position]) == record_id:
+        return position
+    return None
+
+
+def record_positions(table_data, ids):
+    """Возвращает позиции записей с указанными ID по возрастанию."""
+    positions = []
+    start = 0
+    for record_id in sorted(ids):
+        position = find_record_position(table_data, record_id, start)
+        if position is not None:
+            positions.append(position)
+            start = position + 1
+    return positions
+
+
+def records_by_ids(table_data, ids):
+    """Возвращает записи с указанными ID в порядке возрастания ID."""
+    return [table_data[position] for position in record_positions(table_data, ids)]
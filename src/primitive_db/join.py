@@ -0,0 +1,97 @@
+"""Соединение таблиц: хеш-соединение и соединение через индекс.
+
+Функции соединения выдают пары (запись стороны построения или индекса,
+запись просматриваемой стороны) в порядке просматриваемой стороны.
+Записи с отсутствующим значением столбца соединения пар не образуют.
+"""
+import json
+import os
+from contextlib import ExitStack
+
+from .constants import JOIN_BUILD_MAX_ROWS
+from .rows import row_to_json, to_row
+
+
+def _build_table(records, key):
+    """Строит хеш-таблицу {значение столбца: [запись, ...]}."""
+    table = {}
+    for record in records:
+        value = key(record)
+        if value is not None:
+            table.setdefault(value, []).append(record)
+    return table
+
+
+def _probe(table, records, key):
+    for record in records:
+        matches = table.get(key(record))
+        if matches:
+            for match in matches:
+                yield match, record
+
+
+def index_join(probe, probe_key, lookup):
+    """Соединяет записи probe с записями, найденными функцией lookup.
+
+    lookup(значение) возвращает записи другой таблицы с этим значением
+    столбца соединения, например через ее индекс.
+    """
+    for record in probe:
+        value = probe_key(record)
+        if value is not None:
+            for match in lookup(value):
+                yield match, record
+
+
+def hash_join(build, probe, build_key, probe_key, max_rows=JOIN_BUILD_MAX_ROWS):
+    """Соединяет записи хешированием.
+
+    По списку build строится хеш-таблица, записи probe (любой итерируемый
+    объект) читаются потоком один раз. Если в
+    build больше max_rows записей, обе стороны сначала раскладываются по
+    временным файлам-разделам, и хеш-таблица строится для каждого раздела
+    отдельно; тогда пары выдаются по разделам.
+    """
+    if len(build) <= max_rows:
+        return _probe(_build_table(build, build_key), probe, probe_key)
+    partition_count = 2 * -(-len(build) // max_rows)
+    return _spilled_join(build, probe, build_key, probe_key, partition_count)
+
+
+def _write_partitions(records, key, paths):
+    """Раскладывает записи по файлам разделов по хешу значения столбца."""
+    with ExitStack() as stack:
+        files = [
+            stack.enter_context(open(path, "w", encoding="utf-8")) for path in paths
+        ]
+        for record in records:
+            value = key(record)
+            if value is not None:
+                line = json.dumps(record, ensure_ascii=False, default=row_to_json)
+                files[hash(value) % len(files)].write(line + "\n")
+
+
+def _read_partition(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield to_row(json.loads(line))
+
+
+def _spilled_join(build, probe, build_key, probe_key, partition_count):
+    # tempfile тянет за собой shutil и lzma: загружаем только при разделах
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix="primitive_db-join-") as spill_dir:
+        build_paths, probe_paths = (
+            [
+                os.path.join(spill_dir, f"{side}-{i}.jsonl")
+                for i in range(partition_count)
+            ]
+            for side in ("build", "probe")
+        )
+        _write_partitions(build, build_key, build_paths)
+        _write_partitions(probe, probe_key, probe_paths)
+        for build_path, probe_path in zip(build_paths, probe_paths):
+            table = _build_table(_read_partition(build_path), build_key)
+            if table:
+                yield from _probe(table, _read_partition(probe_path), probe_key)
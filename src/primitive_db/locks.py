@@ -0,0 +1,82 @@
+"""Межпроцессные блокировки таблиц и метаданных."""
+import os
+import time
+from contextlib import contextmanager
+
+from .constants import DATA_DIR, DB_META_PATH
+
+try:
+    import fcntl
+except ImportError:
+    # Без fcntl (Windows) блокировки не выполняются
+    fcntl = None
+
+# Блокировки, удерживаемые текущим процессом: путь -> состояние
+_held = {}
+
+
+def get_table_lock_path(table_name):
+    """Возвращает путь к файлу блокировки таблицы."""
+    return os.path.join(DATA_DIR, f"{table_name}.lock")
+
+
+@contextmanager
+def file_lock(lock_path, exclusive=False, timeout=None):
+    """Удерживает разделяемую или исключительную блокировку файла.
+
+    Повторный захват той же блокировки в процессе не блокируется;
+    запрос исключительной блокировки внутри разделяемой повышает ее
+    до конца внешнего захвата. Если задан timeout, а блокировку не
+    удалось получить за это число секунд, выбрасывается TimeoutError.
+    """
+    if fcntl is None:
+        yield
+        return
+
+    state = _held.get(lock_path)
+    if state is not None:
+        if exclusive and not state["exclusive"]:
+            _flock(state["fd"], fcntl.LOCK_EX, timeout)
+            state["exclusive"] = True
+        yield
+        return
+
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        _flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, timeout)
+        _held[lock_path] = {"fd": fd, "exclusive": exclusive}
+        try:
+            yield
+        finally:
+            del _held[lock_path]
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _flock(fd, operation, timeout):
+    if timeout is None:
+        fcntl.flock(fd, operation)
+        return
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError("Не удалось дождаться блокировки.") from None
+            time.sleep(0.01)
+
+
+def table_lock(table_name, exclusive=False, timeout=None):
+    """Блокирует файлы таблицы: читатели разделяют блокировку, писатель - нет."""
+    return file_lock(get_table_lock_path(table_name), exclusive, timeout)
+
+
+def metadata_lock(exclusive=False):
+    """Блокирует файл метаданных базы."""
+    return file_lock(f"{DB_META_PATH}.lock", exclusive)
@@ -1,8 +1,87 @@
-from primitive_db.engine import run
+import argparse
+import sys
+
+from primitive_db.constants import SERVER_PORT, SERVER_SOCKET_PATH
+from primitive_db.engine import run, run_script
+from primitive_db.metrics import dump_json
+from primitive_db.parallel import configure_parallel
+from primitive_db.storage import configure_compression
+from primitive_db.utils import configure_checkpoints, configure_wal
 
 
 def main():
-    run()
+    parser = argparse.ArgumentParser(
+        prog="project", description="Примитивная база данных."
+    )
+    parser.add_argument(
+        "-f", "--file", help="выполнить команды из файла вместо диалога"
+    )
+    parser.add_argument(
+        "-y",
+        "--yes",
+        action="store_true",
+        help="автоматически подтверждать удаление в пакетном режиме",
+    )
+    parser.add_argument(
+        "--serve", action="store_true", help="запустить сервер базы данных"
+    )
+    parser.add_argument(
+        "--socket",
+        default=SERVER_SOCKET_PATH,
+        help="путь к Unix-сокету сервера (пустая строка - без сокета)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=SERVER_PORT,
+        help="локальный TCP-порт сервера (0 - без TCP)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="число процессов для просмотра больших таблиц (1 - без параллелизма)",
+    )
+    parser.add_argument(
+        "--checkpoint-size",
+        type=int,
+        help="размер журнала таблицы в байтах, после которого записывается "
+        "контрольная точка (0 - только командой checkpoint)",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=["always", "never"],
+        help="сбрасывать ли журнал на диск (fsync) после каждого изменения "
+        "(по умолчанию always)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["zlib", "lzma", "none"],
+        help="сжатие столбцов колоночных снимков (по умолчанию zlib)",
+    )
+    parser.add_argument(
+        "--metrics-file", help="сохранить метрики в JSON-файл при завершении"
+    )
+    args = parser.parse_args()
+    configure_parallel(workers=args.workers)
+    configure_checkpoints(log_size=args.checkpoint_size)
+    configure_wal(fsync=args.fsync)
+    configure_compression(args.compression)
+
+    if args.serve:
+        # asyncio нужен только серверу
+        from primitive_db.server import run_server
+
+        run_server(args.socket or None, args.port or None)
+    elif args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            run_script(f, auto_confirm=args.yes)
+    elif not sys.stdin.isatty():
+        run_script(sys.stdin, auto_confirm=args.yes)
+    else:
+        run()
+
+    if args.metrics_file:
+        dump_json(args.metrics_file)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,114 @@
+"""Счетчики и гистограммы задержек операций базы."""
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Верхние границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_counters = {}
+_histograms = {}
+# Стек списков, в которые explain analyze собирает фазы своей команды
+_traces = []
+
+
+def increment(name, value=1):
+    """Увеличивает счетчик."""
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, seconds):
+    """Добавляет длительность операции в ее гистограмму."""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        histogram = {
+            "count": 0,
+            "sum": 0.0,
+            "max": 0.0,
+            "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+        }
+        _histograms[name] = histogram
+    milliseconds = seconds * 1000
+    histogram["count"] += 1
+    histogram["sum"] += milliseconds
+    histogram["max"] = max(histogram["max"], milliseconds)
+    histogram["buckets"][bisect_left(LATENCY_BUCKETS_MS, milliseconds)] += 1
+    for trace in _traces:
+        trace.append((name, seconds))
+
+
+@contextmanager
+def timed(name):
+    """Замеряет длительность блока with как фазу name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def timed_function(name):
+    """Декоратор: замеряет каждый вызов функции как фазу name."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def collect_phases():
+    """Собирает фазы, замеренные внутри блока, в список (имя, секунды)."""
+    trace = []
+    _traces.append(trace)
+    try:
+        yield trace
+    finally:
+        _traces.remove(trace)
+
+
+def _quantile(histogram, fraction):
+    """Оценивает квантиль по корзинам: верхняя граница нужной корзины."""
+    target = fraction * histogram["count"]
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram["buckets"]):
+        seen += count
+        if seen >= target:
+            return min(bound, histogram["max"])
+    return histogram["max"]
+
+
+def snapshot():
+    """Возвращает текущие значения счетчиков и гистограмм."""
+    histograms = {}
+    for name, histogram in sorted(_histograms.items()):
+        bounds = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+        histograms[name] = {
+            "count": histogram["count"],
+            "sum_ms": histogram["sum"],
+            "mean_ms": histogram["sum"] / histogram["count"],
+            "p50_ms": _quantile(histogram, 0.50),
+            "p95_ms": _quantile(histogram, 0.95),
+            "max_ms": histogram["max"],
+            "buckets": dict(zip(bounds, histogram["buckets"])),
+        }
+    return {"counters": dict(sorted(_counters.items())), "histograms": histograms}
+
+
+def dump_json(filepath=None):
+    """Возвращает снимок метрик в JSON и, если задан файл, сохраняет его."""
+    text = json.dumps(snapshot(), indent=4, ensure_ascii=False)
+    if filepath:
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
+
+
+def reset():
+    """Обнуляет все метрики."""
+    _counters.clear()
+    _histograms.clear()
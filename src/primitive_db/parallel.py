@@ -0,0 +1,105 @@
+"""Параллельный просмотр больших таблиц в нескольких процессах.
+
+multiprocessing и concurrent.futures импортируются только перед первым
+параллельным просмотром: короткие запуски программы их не загружают.
+"""
+import os
+from itertools import chain
+
+from .constants import PARALLEL_SCAN_THRESHOLD, PARALLEL_WORKERS
+from .query import aggregate_records, compile_predicate, merge_groups
+
+# Число процессов (0 - по числу ядер) и порог размера таблицы
+_settings = {"workers": PARALLEL_WORKERS, "threshold": PARALLEL_SCAN_THRESHOLD}
+
+# Таблица текущего просмотра: процессы-обработчики получают ее при fork,
+# без копирования записей через pickle
+_shared_table = None
+
+
+def configure_parallel(workers=None, threshold=None):
+    """Меняет число процессов и порог параллельного просмотра."""
+    if workers is not None:
+        _settings["workers"] = workers
+    if threshold is not None:
+        _settings["threshold"] = threshold
+
+
+def _worker_count():
+    return _settings["workers"] or os.cpu_count() or 1
+
+
+def should_parallelize(table_data):
+    """Проверяет, стоит ли делить полный просмотр таблицы между процессами.
+
+    Нужны хотя бы два процесса, таблица не меньше порога и запуск
+    процессов через fork, чтобы они разделяли таблицу с родителем.
+    """
+    if _worker_count() < 2 or len(table_data) < max(_settings["threshold"], 1):
+        return False
+    import multiprocessing
+
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _partition_rows(start, stop):
+    table_data = _shared_table
+    return (table_data[i] for i in range(start, stop))
+
+
+def _filter_partition(start, stop, where):
+    predicate = compile_predicate(where)
+    return [record for record in _partition_rows(start, stop) if predicate(record)]
+
+
+def _aggregate_partition(start, stop, where, aggregates, group_by):
+    records = _partition_rows(start, stop)
+    if where is not None:
+        records = filter(compile_predicate(where), records)
+    return aggregate_records(records, aggregates, group_by)
+
+
+def _map_partitions(table_data, worker, *args):
+    """Выполняет worker для диапазонов строк в отдельных процессах.
+
+    Результаты возвращаются в порядке диапазонов, то есть в порядке ID.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    global _shared_table
+    row_count = len(table_data)
+    workers = min(_worker_count(), row_count) or 1
+    size = -(-row_count // workers)
+    partitions = [
+        (start, min(start + size, row_count)) for start in range(0, row_count, size)
+    ]
+
+    _shared_table = table_data
+    try:
+        with ProcessPoolExecutor(
+            len(partitions), mp_context=multiprocessing.get_context("fork")
+        ) as executor:
+            futures = [
+                executor.submit(worker, start, stop, *args)
+                for start, stop in partitions
+            ]
+            return [future.result() for future in futures]
+    finally:
+        _shared_table = None
+
+
+def parallel_filter(table_data, where):
+    """Отбирает записи по условию в нескольких процессах, сохраняя порядок ID."""
+    partials = _map_partitions(table_data, _filter_partition, where)
+    return list(chain.from_iterable(partials))
+
+
+def parallel_aggregate(table_data, where, aggregates, group_by=()):
+    """Накапливает состояния агрегатов по частям таблицы и объединяет их."""
+    groups = {}
+    for partial in _map_partitions(
+        table_data, _aggregate_partition, where, aggregates, group_by
+    ):
+        merge_groups(groups, partial, aggregates)
+    return groups
@@ -0,0 +1,563 @@
+"""Разбор запросов, компиляция условий WHERE и выбор пути доступа.
+
+Условие разбирается в дерево из кортежей:
+    ("cmp", столбец, оператор, значение)
+    ("between", столбец, нижняя_граница, верхняя_граница)
+    ("in", столбец, (значение, ...))
+    ("and", (узел, ...)), ("or", (узел, ...))
+Перед выполнением значения в дереве приводятся к типам столбцов
+(см. core), после чего дерево компилируется в функцию-предикат.
+"""
+import operator
+import re
+from bisect import bisect_left, bisect_right
+
+from .indexes import index_lookup, index_range, records_by_ids
+from .metrics import timed_function
+from .rows import column_getter
+from .vector import vector_filter
+
+COMPARISON_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+AGGREGATE_FUNCTIONS = ("count", "sum", "min", "max", "avg")
+
+_TOKEN_RE = re.compile(
+    r"""\s*(?:
+        "(?P<dquoted>[^"]*)"
+        |'(?P<squoted>[^']*)'
+        |(?P<op><=|>=|!=|<>|=|<|>|\(|\)|,|\*)
+        |(?P<word>[^\s=<>!(),'"*]+)
+    )""",
+    re.VERBOSE,
+)
+
+
+def tokenize(text):
+    """Разбивает команду на лексемы вида (тип, текст).
+
+    Тип - "str" для строк в кавычках, "op" для операторов и скобок,
+    "word" для остальных слов.
+    """
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if not match:
+            raise ValueError(f'Неожиданный символ "{text[position]}".')
+        position = match.end()
+        if match.group("dquoted") is not None:
+            tokens.append(("str", match.group("dquoted")))
+        elif match.group("squoted") is not None:
+            tokens.append(("str", match.group("squoted")))
+        elif match.group("op") is not None:
+            tokens.append(("op", match.group("op")))
+        else:
+            tokens.append(("word", match.group("word")))
+    return tokens
+
+
+class _Parser:
+    """Рекурсивный разбор условий и запросов select."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None, None
+
+    def peek_word(self):
+        kind, text = self.peek()
+        return text.lower() if kind == "word" else None
+
+    def advance(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def expect_op(self, op):
+        if self.peek() != ("op", op):
+            raise ValueError(f'Ожидается "{op}".')
+        self.advance()
+
+    def expect_word(self, word):
+        if self.peek_word() != word:
+            raise ValueError(f'Ожидается "{word}".')
+        self.advance()
+
+    def take_name(self):
+        kind, text = self.advance()
+        if kind != "word":
+            raise ValueError("Ожидается имя столбца или таблицы.")
+        return text
+
+    def take_value(self):
+        kind, text = self.advance()
+        if kind not in ("word", "str"):
+            raise ValueError("Ожидается значение.")
+        return text
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek_word() == "or":
+            self.advance()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", tuple(nodes))
+
+    def parse_and(self):
+        nodes = [self.parse_term()]
+        while self.peek_word() == "and":
+            self.advance()
+            nodes.append(self.parse_term())
+        return nodes[0] if len(nodes) == 1 else ("and", tuple(nodes))
+
+    def parse_term(self):
+        if self.peek() == ("op", "("):
+            self.advance()
+            node = self.parse_or()
+            self.expect_op(")")
+            return node
+
+        column = self.take_name()
+        keyword = self.peek_word()
+        if keyword == "between":
+            self.advance()
+            low = self.take_value()
+            self.expect_word("and")
+            return ("between", column, low, self.take_value())
+        if keyword == "in":
+            self.advance()
+            self.expect_op("(")
+            values = [self.take_value()]
+            while self.peek() == ("op", ","):
+                self.advance()
+                values.append(self.take_value())
+            self.expect_op(")")
+            return ("in", column, tuple(values))
+
+        kind, op = self.advance()
+        if kind != "op" or op not in COMPARISON_OPERATORS and op != "<>":
+            raise ValueError(f'Ожидается оператор сравнения после "{column}".')
+        return ("cmp", column, "!=" if op == "<>" else op, self.take_value())
+
+
+@timed_function("parse")
+def parse_where_clause(text):
+    """Находит в команде условие после where и разбирает его.
+
+    Возвращает None, если условия нет. Лексемы после условия
+    (limit, to и т.п.) не разбираются.
+    """
+    tokens = tokenize(text)
+    for position, (kind, word) in enumerate(tokens):
+        if kind == "word" and word.lower() == "where":
+            parser = _Parser(tokens)
+            parser.position = position + 1
+            return parser.parse_or()
+    return None
+
+
+@timed_function("parse")
+def parse_select(text):
+    """Разбирает команду select.
+
+    select [<столбец> | <функция>(<столбец>|*), ... | *] from <таблица>
+        [join <таблица> on <столбец> = <столбец>]
+        [where <условие>] [group by <столбец>, ...]
+        [limit N] [offset M] [paged]
+
+    Элемент списка выборки - имя столбца или пара (функция, столбец).
+    Соединение возвращается как {"table": таблица, "on": (столбец, столбец)}.
+    """
+    parser = _Parser(tokenize(text))
+    parser.expect_word("select")
+
+    columns = []
+    if parser.peek() == ("op", "*"):
+        parser.advance()
+    elif parser.peek_word() != "from":
+        while True:
+            name = parser.take_name()
+            if parser.peek() == ("op", "("):
+                parser.advance()
+                columns.append(_parse_aggregate(parser, name.lower()))
+            else:
+                columns.append(name)
+            if parser.peek() != ("op", ","):
+                break
+            parser.advance()
+    parser.expect_word("from")
+
+    query = {
+        "table": parser.take_name(),
+        "columns": columns or None,
+        "join": None,
+        "where": None,
+        "group_by": [],
+        "limit": None,
+        "offset": 0,
+        "paged": False,
+    }
+    if parser.peek_word() == "join":
+        parser.advance()
+        join_table = parser.take_name()
+        parser.expect_word("on")
+        left = parser.take_name()
+        parser.expect_op("=")
+        query["join"] = {"table": join_table, "on": (left, parser.take_name())}
+    while parser.peek() != (None, None):
+        keyword = parser.peek_word()
+        parser.advance()
+        if keyword == "where":
+            query["where"] = parser.parse_or()
+        elif keyword == "group":
+            parser.expect_word("by")
+            query["group_by"].append(parser.take_name())
+            while parser.peek() == ("op", ","):
+                parser.advance()
+                query["group_by"].append(parser.take_name())
+        elif keyword in ("limit", "offset"):
+            value = parser.take_value()
+            if not value.isdigit():
+                raise ValueError(
+                    f'После "{keyword}" ожидается неотрицательное число.'
+                )
+            query[keyword] = int(value)
+        elif keyword == "paged":
+            query["paged"] = True
+        else:
+            raise ValueError("Неожиданное продолжение запроса.")
+    return query
+
+
+def _parse_aggregate(parser, function):
+    """Разбирает аргумент агрегатной функции после открывающей скобки."""
+    if function not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f'Неизвестная функция "{function}".')
+    if parser.peek() == ("op", "*"):
+        if function != "count":
+            raise ValueError(f'Функция "{function}" не принимает "*".')
+        parser.advance()
+        column = "*"
+    else:
+        column = parser.take_name()
+    parser.expect_op(")")
+    return function, column
+
+
+def is_aggregate_query(query):
+    """Проверяет, содержит ли запрос агрегатные функции или group by."""
+    columns = query["columns"] or []
+    return bool(query["group_by"]) or any(
+        not isinstance(item, str) for item in columns
+    )
+
+
+def item_label(item):
+    """Возвращает заголовок столбца результата для элемента выборки."""
+    if isinstance(item, str):
+        return item
+    function, column = item
+    return f"{function}({column})"
+
+
+def where_columns(where):
+    """Возвращает множество столбцов, упомянутых в условии."""
+    if where[0] in ("and", "or"):
+        return set().union(*(where_columns(node) for node in where[1]))
+    return {where[1]}
+
+
+def rename_columns(where, names):
+    """Возвращает условие, в котором столбцы заменены по словарю names."""
+    if where[0] in ("and", "or"):
+        return (where[0], tuple(rename_columns(node, names) for node in where[1]))
+    return (where[0], names[where[1]], *where[2:])
+
+
+def compile_predicate(where):
+    """Компилирует условие с приведенными значениями в функцию-предикат."""
+    kind = where[0]
+    if kind in ("and", "or"):
+        predicates = [compile_predicate(node) for node in where[1]]
+        if len(predicates) == 2:
+            first, second = predicates
+            if kind == "and":
+                return lambda record: first(record) and second(record)
+            return lambda record: first(record) or second(record)
+        combine = all if kind == "and" else any
+        return lambda record: combine(predicate(record) for predicate in predicates)
+
+    get_value = column_getter(where[1])
+    if kind == "in":
+        values = frozenset(value for value in where[2] if value is not None)
+        return lambda record: get_value(record) in values
+
+    if kind == "between":
+        low, high = where[2], where[3]
+        if low is None or high is None:
+            return lambda record: False
+
+        def between(record):
+            value = get_value(record)
+            return value is not None and low <= value <= high
+
+        return between
+
+    _, _, op, value = where
+    if value is None:
+        return lambda record: False
+    if op == "=":
+        return lambda record: get_value(record) == value
+    if op == "!=":
+        return lambda record: get_value(record) != value
+
+    compare = COMPARISON_OPERATORS[op]
+
+    def compare_record(record):
+        record_value = get_value(record)
+        return record_value is not None and compare(record_value, value)
+
+    return compare_record
+
+
+def _id_range(table_data, low, high):
+    """Возвращает записи с ID в диапазоне [low, high] (записи упорядочены)."""
+    get_id = column_getter("ID")
+    start = 0 if low is None else bisect_left(table_data, low, key=get_id)
+    end = len(table_data) if high is None else bisect_right(
+        table_data, high, key=get_id
+    )
+    return table_data[start:end]
+
+
+def _range_bounds(where):
+    """Возвращает границы диапазона для условия или None."""
+    kind = where[0]
+    if kind == "between":
+        return where[2], where[3]
+    if kind == "cmp" and where[2] in ("<", "<="):
+        return None, where[3]
+    if kind == "cmp" and where[2] in (">", ">="):
+        return where[3], None
+    return None
+
+
+def _candidates(table_data, where, indexes):
+    """Подбирает записи-кандидаты через индекс; None - нужен полный просмотр.
+
+    Кандидаты - надмножество результата, предикат проверяется для них
+    отдельно. Из конъюнкций выбирается условие на равенство, а если его
+    нет - на диапазон.
+    """
+    kind = where[0]
+    if kind == "and":
+        nodes = sorted(
+            where[1], key=lambda node: node[0] != "in" and node[2:3] != ("=",)
+        )
+        for node in nodes:
+            candidates = _candidates(table_data, node, indexes)
+            if candidates is not None:
+                return candidates
+        return None
+    if kind == "or":
+        return None
+
+    column = where[1]
+    if column != "ID" and column not in indexes:
+        return None
+
+    if kind == "in" or where[2:3] == ("=",):
+        values = where[2] if kind == "in" else (where[3],)
+        values = [value for value in values if value is not None]
+        if column == "ID":
+            return records_by_ids(table_data, values)
+        ids = set()
+        for value in values:
+            ids.update(index_lookup(indexes[column], value))
+        return records_by_ids(table_data, ids)
+
+    bounds = _range_bounds(where)
+    if bounds is None:
+        return None
+    low, high = bounds
+    if column == "ID":
+        return _id_range(table_data, low, high)
+    return records_by_ids(table_data, index_range(indexes[column], low, high))
+
+
+def uses_index(where, indexes):
+    """Проверяет, сузит ли индекс (или условие на ID) круг кандидатов."""
+    kind = where[0]
+    if kind == "and":
+        return any(uses_index(node, indexes) for node in where[1])
+    if kind == "or":
+        return False
+    if where[1] != "ID" and where[1] not in indexes:
+        return False
+    return kind == "in" or where[2:3] == ("=",) or _range_bounds(where) is not None
+
+
+def iter_where(table_data, where, indexes=None):
+    """Перебирает записи, удовлетворяющие условию с приведенными значениями.
+
+    При наличии подходящего индекса (или условия на ID) просматриваются
+    только кандидаты из индекса, иначе - вся таблица: большая таблица
+    просматривается по столбцам (см. vector), если условие это позволяет.
+    """
+    if where is None:
+        return iter(table_data)
+    candidates = _candidates(table_data, where, indexes or {})
+    if candidates is None:
+        records = vector_filter(table_data, where)
+        if records is not None:
+            return records
+        candidates = table_data
+    return filter(compile_predicate(where), candidates)
+
+
+# Состояние агрегата - список [накопленное значение, число значений]
+def _step_count(state, value):
+    state[1] += 1
+
+
+def _step_sum(state, value):
+    state[0] += value
+    state[1] += 1
+
+
+def _step_min(state, value):
+    if not state[1] or value < state[0]:
+        state[0] = value
+    state[1] += 1
+
+
+def _step_max(state, value):
+    if not state[1] or value > state[0]:
+        state[0] = value
+    state[1] += 1
+
+
+_AGGREGATE_STEPS = {
+    "count": _step_count,
+    "sum": _step_sum,
+    "avg": _step_sum,
+    "min": _step_min,
+    "max": _step_max,
+}
+
+
+def _merge_count(state, other):
+    state[1] += other[1]
+
+
+def _merge_sum(state, other):
+    state[0] += other[0]
+    state[1] += other[1]
+
+
+def _merge_min(state, other):
+    if other[1]:
+        _step_min(state, other[0])
+        state[1] += other[1] - 1
+
+
+def _merge_max(state, other):
+    if other[1]:
+        _step_max(state, other[0])
+        state[1] += other[1] - 1
+
+
+_AGGREGATE_MERGES = {
+    "count": _merge_count,
+    "sum": _merge_sum,
+    "avg": _merge_sum,
+    "min": _merge_min,
+    "max": _merge_max,
+}
+
+
+def _initial_state(function):
+    return [None, 0] if function in ("min", "max") else [0, 0]
+
+
+def _final_value(function, state):
+    accumulated, count = state
+    if function == "count":
+        return count
+    if not count:
+        return None
+    if function == "avg":
+        return accumulated / count
+    return accumulated
+
+
+def aggregate_records(records, aggregates, group_by=()):
+    """Накапливает состояния агрегатов по группам за один проход.
+
+    Возвращает словарь {ключ группы: [состояние агрегата, ...]}.
+    """
+    steps = [
+        (_AGGREGATE_STEPS[function], None if column == "*" else column_getter(column))
+        for function, column in aggregates
+    ]
+    key_getters = [column_getter(column) for column in group_by]
+    groups = {}
+    for record in records:
+        key = tuple(get_key(record) for get_key in key_getters)
+        states = groups.get(key)
+        if states is None:
+            states = [_initial_state(function) for function, _ in aggregates]
+            groups[key] = states
+        for state, (step, get_value) in zip(states, steps):
+            value = 1 if get_value is None else get_value(record)
+            if value is not None:
+                step(state, value)
+    return groups
+
+
+def merge_groups(groups, other, aggregates):
+    """Добавляет к состояниям групп состояния, накопленные по другой части."""
+    merges = [_AGGREGATE_MERGES[function] for function, _ in aggregates]
+    for key, other_states in other.items():
+        states = groups.get(key)
+        if states is None:
+            groups[key] = other_states
+            continue
+        for merge, state, other_state in zip(merges, states, other_states):
+            merge(state, other_state)
+    return groups
+
+
+def finalize_groups(groups, items, group_by=()):
+    """Превращает состояния агрегатов в строки результата."""
+    aggregates = [item for item in items if not isinstance(item, str)]
+    if not groups and not group_by:
+        # Агрегаты по пустой выборке без group by дают одну строку
+        groups = {(): [_initial_state(function) for function, _ in aggregates]}
+
+    rows = []
+    for key, states in groups.items():
+        values = dict(zip(group_by, key))
+        finals = iter(
+            _final_value(function, state)
+            for (function, _), state in zip(aggregates, states)
+        )
+        rows.append(
+            {
+                item_label(item): values[item] if isinstance(item, str)
+                else next(finals)
+                for item in items
+            }
+        )
+    return rows
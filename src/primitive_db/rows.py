@@ -0,0 +1,241 @@
+"""Компактное представление записей таблиц.
+
+Запись хранит значения в слотах класса, созданного для набора ее столбцов,
+а не в словаре: имена столбцов хранятся один раз в классе, а не в каждой
+записи. Для остального кода запись ведет себя как словарь с методами get,
+update и обращением по имени столбца. В словари записи превращаются
+только на выходе: при сохранении в JSON и в результатах выборки столбцов.
+"""
+from operator import attrgetter
+
+# Под этим префиксом в классе записи доступны значения столбцов:
+# attrgetter по такому имени читает значение без вызова методов записи
+_COLUMN_PREFIX = "column:"
+
+_row_types = {}
+
+# Сколько диапазонов delete_runs удаляет по месту; при большем числе
+# список дешевле собрать заново из оставшихся кусков
+_MAX_RUNS_IN_PLACE = 32
+
+
+class Row:
+    """Базовый класс записей; столбцы задает класс, созданный row_type."""
+
+    __slots__ = ()
+    _fields = ()
+    _slots = {}
+
+    def get(self, column, default=None):
+        slot = self._slots.get(column)
+        if slot is None:
+            return default
+        return getattr(self, slot)
+
+    def __getitem__(self, column):
+        slot = self._slots.get(column)
+        if slot is None:
+            raise KeyError(column)
+        return getattr(self, slot)
+
+    def __setitem__(self, column, value):
+        slot = self._slots.get(column)
+        if slot is None:
+            raise KeyError(column)
+        setattr(self, slot, value)
+
+    def update(self, values):
+        """Меняет значения столбцов из словаря {столбец: значение}."""
+        for column, value in values.items():
+            self[column] = value
+
+    def __contains__(self, column):
+        return column in self._slots
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return self._get_values(self)
+
+    def items(self):
+        return list(zip(self._fields, self._get_values(self)))
+
+    def to_dict(self):
+        """Возвращает запись в виде словаря."""
+        return dict(zip(self._fields, self._get_values(self)))
+
+    def __eq__(self, other):
+        if isinstance(other, (Row, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        # Классы записей создаются на лету, поэтому для передачи записи
+        # в другой процесс сохраняются имена столбцов и значения
+        return _restore_row, (self._fields, self._get_values(self))
+
+
+def _make_init(slots):
+    """Создает __init__, раскладывающий значения по слотам одним присваиванием.
+
+    Код собирается из номеров слотов, как в collections.namedtuple:
+    это в разы быстрее цикла по слотам при загрузке больших таблиц.
+    """
+    targets = "".join(f"self.{slot}, " for slot in slots)
+    body = f"{targets}= values" if slots else "pass"
+    namespace = {}
+    exec(f"def __init__(self, values):\n    {body}\n", namespace)
+    return namespace["__init__"]
+
+
+def row_type(fields):
+    """Возвращает класс записей с заданными столбцами.
+
+    Для одного набора столбцов класс создается один раз.
+    """
+    fields = tuple(fields)
+    cls = _row_types.get(fields)
+    if cls is not None:
+        return cls
+
+    # Имена столбцов могут не быть идентификаторами Python,
+    # поэтому слоты нумеруются
+    slots = tuple(f"_{i}" for i in range(len(fields)))
+    get_values = attrgetter(*slots) if slots else (lambda record: ())
+    if len(slots) == 1:
+        get_one = get_values
+        get_values = lambda record: (get_one(record),)  # noqa: E731
+    cls = type(
+        "Row",
+        (Row,),
+        {
+            "__slots__": slots,
+            "__init__": _make_init(slots),
+            "_fields": fields,
+            "_slots": dict(zip(fields, slots)),
+            "_get_values": staticmethod(get_values),
+        },
+    )
+    for field, slot in zip(fields, slots):
+        setattr(cls, _COLUMN_PREFIX + field, getattr(cls, slot))
+    _row_types[fields] = cls
+    return cls
+
+
+def _restore_row(fields, values):
+    return row_type(fields)(values)
+
+
+def column_getter(column):
+    """Возвращает функцию чтения значения столбца из записи."""
+    if "." in column:
+        # attrgetter понимает точку как обращение к вложенному атрибуту
+        return lambda record: record.get(column)
+    return attrgetter(_COLUMN_PREFIX + column)
+
+
+class RowList(list):
+    """Список записей таблицы.
+
+    В атрибуте columns хранится кэш столбцов для векторного просмотра
+    (см. vector); при изменении записей его обновляет apply_change.
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, records=()):
+        super().__init__(records)
+        self.columns = None
+
+    def column_values(self, column):
+        """Возвращает значения столбца по порядку записей или None."""
+        try:
+            return list(map(column_getter(column), self))
+        except AttributeError:
+            return None
+
+
+def position_runs(positions):
+    """Группирует возрастающие позиции в диапазоны [начало, конец)."""
+    runs = []
+    for position in positions:
+        if runs and runs[-1][1] == position:
+            runs[-1][1] = position + 1
+        else:
+            runs.append([position, position + 1])
+    return runs
+
+
+def delete_runs(values, runs):
+    """Удаляет из списка или массива диапазоны позиций на месте.
+
+    Оставшиеся элементы не перебираются по одному: немногие диапазоны
+    вырезаются срезами, а при большом их числе список собирается заново
+    из кусков между диапазонами.
+    """
+    if len(runs) <= _MAX_RUNS_IN_PLACE:
+        for start, stop in reversed(runs):
+            del values[start:stop]
+        return
+    kept = values[:0]
+    previous = 0
+    for start, stop in runs:
+        kept += values[previous:start]
+        previous = stop
+    kept += values[previous:]
+    values[:] = kept
+
+
+def to_row(record):
+    """Превращает словарь в запись; запись возвращается как есть."""
+    if isinstance(record, Row):
+        return record
+    return row_type(record)(record.values())
+
+
+def to_rows(records):
+    """Превращает список словарей в записи.
+
+    Словари одной таблицы обычно имеют одинаковые ключи, поэтому класс
+    записи ищется заново только при смене набора ключей.
+    """
+    rows = []
+    fields = make_row = None
+    for record in records:
+        if isinstance(record, Row):
+            rows.append(record)
+            continue
+        keys = tuple(record)
+        if keys != fields:
+            fields, make_row = keys, row_type(keys)
+        rows.append(make_row(record.values()))
+    return rows
+
+
+def to_dicts(records):
+    """Превращает записи в словари для вывода и сохранения."""
+    return [
+        record.to_dict() if isinstance(record, Row) else record
+        for record in records
+    ]
+
+
+def row_to_json(value):
+    """Обработчик default для json.dumps: записи сохраняются словарями."""
+    if isinstance(value, Row):
+        return value.to_dict()
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
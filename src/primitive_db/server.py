@@ -0,0 +1,148 @@
+"""Сервер базы данных: команды по Unix-сокету и локальному TCP.
+
+Протокол построчный. Запрос - строка с командой или JSON-объект
+{"command": "..."}; ответ - одна строка JSON {"ok": ..., "output": "..."}.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from .constants import SERVER_HOST, SERVER_LINE_LIMIT
+from .decorators import configure
+from .engine import create_session, execute
+from .parallel import configure_parallel
+from .utils import ensure_data_dir
+
+# Транзакция принадлежит сеансу, а сеанс сервера общий для всех клиентов
+SESSION_COMMANDS = {"begin", "commit", "rollback"}
+CLOSE_COMMANDS = {"exit", "quit"}
+
+
+def _run_command(command, session):
+    """Выполняет команду и возвращает ее вывод."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        execute(command, session)
+    return output.getvalue()
+
+
+def _parse_request(line):
+    """Извлекает команду из строки запроса."""
+    text = line.decode("utf-8").strip()
+    if text.startswith("{"):
+        command = json.loads(text)["command"]
+        if not isinstance(command, str):
+            raise ValueError("команда должна быть строкой")
+        return command.strip()
+    return text
+
+
+async def _handle_client(reader, writer, session, executor):
+    """Обслуживает одно соединение до его закрытия."""
+    loop = asyncio.get_running_loop()
+    try:
+        while line := await reader.readline():
+            closing = False
+            try:
+                command = _parse_request(line)
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"ok": False, "output": f"Некорректный запрос: {e}"}
+            else:
+                name = command.split(maxsplit=1)[0].lower() if command else ""
+                if name in CLOSE_COMMANDS:
+                    closing = True
+                    response = {"ok": True, "output": "Соединение закрыто.\n"}
+                elif name in SESSION_COMMANDS:
+                    response = {
+                        "ok": False,
+                        "output": f'Команда "{name}" недоступна в режиме сервера.',
+                    }
+                else:
+                    output = await loop.run_in_executor(
+                        executor, _run_command, command, session
+                    )
+                    response = {"ok": True, "output": output}
+
+            data = json.dumps(response, ensure_ascii=False) + "\n"
+            writer.write(data.encode("utf-8"))
+            await writer.drain()
+            if closing:
+                break
+    except (ConnectionError, ValueError):
+        # Клиент отключился или прислал слишком длинную строку
+        pass
+    finally:
+        writer.close()
+        with contextlib.suppress(ConnectionError):
+            await writer.wait_closed()
+
+
+async def serve(socket_path=None, port=None):
+    """Запускает сервер на Unix-сокете и/или локальном TCP-порту.
+
+    Все клиенты используют один сеанс, поэтому таблицы остаются в памяти
+    между запросами. Команды выполняются по одной в отдельном потоке:
+    цикл событий продолжает принимать соединения, а изменения таблиц
+    не пересекаются.
+    """
+    ensure_data_dir()
+    # У сервера нет пользователя для вопросов: input() занял бы
+    # единственный поток команд
+    configure(auto_confirm=True, quiet=True, interactive=False)
+    # fork из процесса с потоками и циклом событий может зависнуть на
+    # блокировке, захваченной другим потоком, - просмотр последовательный
+    configure_parallel(workers=1)
+    session = create_session()
+    executor = ThreadPoolExecutor(max_workers=1)
+    handler = partial(_handle_client, session=session, executor=executor)
+
+    servers = []
+    if socket_path and hasattr(socket, "AF_UNIX"):
+        servers.append(
+            await asyncio.start_unix_server(
+                handler, path=socket_path, limit=SERVER_LINE_LIMIT
+            )
+        )
+        print(f"Сервер слушает сокет {socket_path}")
+    if port is not None:
+        servers.append(
+            await asyncio.start_server(
+                handler, SERVER_HOST, port, limit=SERVER_LINE_LIMIT
+            )
+        )
+        print(f"Сервер слушает {SERVER_HOST}:{port}")
+    if not servers:
+        raise ValueError("Не задан ни сокет, ни порт сервера.")
+
+    serving = asyncio.gather(*(server.serve_forever() for server in servers))
+    with contextlib.suppress(NotImplementedError):
+        # SIGTERM завершает сервер так же штатно, как Ctrl+C
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, serving.cancel
+        )
+    try:
+        await serving
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for server in servers:
+            server.close()
+        executor.shutdown(wait=True)
+        session["pool"].flush()
+        if socket_path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(socket_path)
+
+
+def run_server(socket_path=None, port=None):
+    """Запускает сервер до прерывания с клавиатуры."""
+    try:
+        asyncio.run(serve(socket_path, port))
+    except KeyboardInterrupt:
+        print("\nСервер остановлен.")
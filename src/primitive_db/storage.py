@@ -0,0 +1,513 @@
+"""Форматы хранения снимков таблиц: JSON и колоночный бинарный.
+
+В колоночном формате строковый столбец хранится словарем различных
+значений и массивом их кодов, если так он занимает меньше места, а
+столбец, который хорошо сжимается, - сжатым zlib или lzma. Выбор
+делается при записи по статистике каждого столбца.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+
+from .constants import (
+    COLUMNAR_COMPRESSION,
+    COLUMNAR_COMPRESSION_MIN_SAVING,
+    COLUMNAR_COMPRESSION_MIN_SIZE,
+    DATA_DIR,
+)
+from .rows import RowList, row_type, to_dicts, to_rows
+from .vector import ColumnStore, dictionary_column
+
+# Заголовок колоночного файла: сигнатура, версия, число строк и столбцов.
+# В версии 1 у столбцов нет кода сжатия, такие файлы по-прежнему читаются
+COLUMNAR_MAGIC = b"PDBC"
+COLUMNAR_VERSION = 2
+_FILE_HEADER = struct.Struct("<4sBIH")
+_COLUMN_HEADER = struct.Struct("<H")
+_COLUMN_PAYLOAD = {1: struct.Struct("<cQ"), 2: struct.Struct("<ccQ")}
+
+# Коды типов столбцов; "j" - значения произвольного вида в виде JSON-строк,
+# "d" - строки словарем: код массива кодов и размер словаря, строки
+# словаря, затем коды значений
+_ARRAY_TYPECODES = {b"i": "q", b"b": "b"}
+_OFFSET_TYPECODE = "I"
+_DICTIONARY_HEADER = struct.Struct("<cI")
+
+# Коды сжатия столбцов
+_UNCOMPRESSED = b"-"
+_CODEC_CODES = {"zlib": b"z", "lzma": b"x"}
+# Снимок переписывается в каждой контрольной точке, поэтому уровни сжатия
+# выбраны быстрые
+_CODEC_OPTIONS = {b"z": {"level": 1}, b"x": {"preset": 1}}
+# Сжатие сначала пробуется на начале столбца такого размера
+_COMPRESSION_SAMPLE = 64 * 1024
+
+_settings = {"compression": COLUMNAR_COMPRESSION}
+
+
+def configure_compression(codec=None):
+    """Меняет сжатие столбцов колоночных снимков: "zlib", "lzma" или "none"."""
+    if codec is not None:
+        _settings["compression"] = None if codec == "none" else codec
+
+
+class CorruptSnapshotError(ValueError):
+    """Снимок таблицы не читается или не совпадает с контрольной суммой."""
+
+
+def get_snapshot_path(table_name, storage):
+    """Возвращает путь к файлу снимка таблицы в заданном формате."""
+    extension = {"json": "json", "columnar": "col"}[storage]
+    return os.path.join(DATA_DIR, f"{table_name}.{extension}")
+
+
+def write_atomic(filepath, content):
+    """Записывает файл целиком через временный файл и переименование.
+
+    Читатели видят либо прежнее, либо новое содержимое, но не половину.
+    """
+    temp_path = f"{filepath}.{os.getpid()}.tmp"
+    mode = "wb" if isinstance(content, bytes) else "w"
+    encoding = None if isinstance(content, bytes) else "utf-8"
+    with open(temp_path, mode, encoding=encoding) as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, filepath)
+
+
+def _to_little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _column_type_code(values):
+    """Определяет тип столбца по его значениям."""
+    if all(type(value) is bool for value in values):
+        return b"b"
+    if all(type(value) is int for value in values):
+        return b"i"
+    if all(type(value) is str for value in values):
+        return b"s"
+    return b"j"
+
+
+def _encode_strings(strings):
+    """Кодирует строки как массив смещений и общий буфер UTF-8."""
+    offsets = array(_OFFSET_TYPECODE, [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode("utf-8")
+        offsets.append(len(blob))
+    return _to_little_endian(offsets).tobytes() + bytes(blob)
+
+
+def _decode_strings(payload, row_count):
+    offsets = array(_OFFSET_TYPECODE)
+    offsets_size = offsets.itemsize * (row_count + 1)
+    offsets.frombytes(payload[:offsets_size])
+    _to_little_endian(offsets)
+    blob = payload[offsets_size:]
+    return [
+        bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+        for i in range(row_count)
+    ]
+
+
+def _code_typecode(dictionary_size):
+    """Выбирает самый узкий массив для кодов словаря такого размера."""
+    if dictionary_size <= 1 << 8:
+        return "B"
+    if dictionary_size <= 1 << 16:
+        return "H"
+    return "i"
+
+
+def _encode_string_column(values):
+    """Кодирует строковый столбец строками подряд или словарем.
+
+    Выбирается меньший по размеру вариант: словарь выгоден, когда
+    различных значений мало и они повторяются.
+    """
+    counts = Counter(values)
+    encoded = {value: len(value.encode("utf-8")) for value in counts}
+    offset_size = array(_OFFSET_TYPECODE).itemsize
+    typecode = _code_typecode(len(counts))
+    plain_size = offset_size * (len(values) + 1) + sum(
+        encoded[value] * count for value, count in counts.items()
+    )
+    dictionary_size = (
+        _DICTIONARY_HEADER.size
+        + offset_size * (len(counts) + 1)
+        + sum(encoded.values())
+        + array(typecode).itemsize * len(values)
+    )
+    if dictionary_size >= plain_size:
+        return b"s", _encode_strings(values)
+
+    codes = {value: code for code, value in enumerate(counts)}
+    code_array = _to_little_endian(array(typecode, map(codes.__getitem__, values)))
+    return b"d", b"".join(
+        [
+            _DICTIONARY_HEADER.pack(typecode.encode("ascii"), len(counts)),
+            _encode_strings(counts),
+            code_array.tobytes(),
+        ]
+    )
+
+
+def _decode_dictionary(payload, row_count, copy=True):
+    """Возвращает словарь строкового столбца и массив кодов его значений.
+
+    copy=False на платформе с порядком байт файла отдает коды срезом
+    payload без копирования.
+    """
+    typecode, size = _DICTIONARY_HEADER.unpack_from(payload)
+    typecode = typecode.decode("ascii")
+    position = _DICTIONARY_HEADER.size
+    offsets = array(_OFFSET_TYPECODE)
+    offsets.frombytes(payload[position:position + offsets.itemsize * (size + 1)])
+    _to_little_endian(offsets)
+    end = position + offsets.itemsize * (size + 1) + offsets[-1]
+    dictionary = _decode_strings(payload[position:end], size)
+
+    codes = payload[end:end + array(typecode).itemsize * row_count]
+    if copy or sys.byteorder == "big":
+        code_array = array(typecode)
+        code_array.frombytes(codes)
+        return dictionary, _to_little_endian(code_array)
+    return dictionary, codes.cast(typecode)
+
+
+def _codec(code):
+    """Возвращает модуль сжатия по его коду в файле."""
+    if code == _CODEC_CODES["zlib"]:
+        return zlib
+    if code == _CODEC_CODES["lzma"]:
+        # lzma нужен только для таблиц, сжатых им
+        import lzma
+
+        return lzma
+    raise ValueError("Неизвестный способ сжатия столбца.")
+
+
+def _compress(payload):
+    """Сжимает данные столбца, если это экономит заметную долю места.
+
+    Сначала сжимается начало столбца: плохо сжимающиеся данные целиком
+    не сжимаются.
+    """
+    codec = _settings["compression"]
+    if codec is None or len(payload) < COLUMNAR_COMPRESSION_MIN_SIZE:
+        return _UNCOMPRESSED, payload
+    code = _CODEC_CODES[codec]
+    limit = 1 - COLUMNAR_COMPRESSION_MIN_SAVING
+    if len(payload) > _COMPRESSION_SAMPLE:
+        sample = payload[:_COMPRESSION_SAMPLE]
+        compressed = _codec(code).compress(sample, **_CODEC_OPTIONS[code])
+        if len(compressed) > len(sample) * limit:
+            return _UNCOMPRESSED, payload
+    compressed = _codec(code).compress(payload, **_CODEC_OPTIONS[code])
+    if len(compressed) > len(payload) * limit:
+        return _UNCOMPRESSED, payload
+    return code, compressed
+
+
+def _decompress(codec, payload):
+    if codec == _UNCOMPRESSED:
+        return payload
+    return memoryview(_codec(codec).decompress(payload))
+
+
+def _column_names(data):
+    """Собирает имена столбцов в порядке их появления в записях."""
+    names = {}
+    for record in data:
+        for name in record:
+            names.setdefault(name)
+    return list(names)
+
+
+def encode_columnar(data):
+    """Кодирует записи таблицы в колоночный бинарный формат."""
+    names = _column_names(data)
+    parts = [
+        _FILE_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(data), len(names))
+    ]
+    for name in names:
+        values = [record.get(name) for record in data]
+        type_code = _column_type_code(values)
+        if type_code in _ARRAY_TYPECODES:
+            try:
+                values_array = array(_ARRAY_TYPECODES[type_code], values)
+            except OverflowError:
+                # Числа вне 64 бит хранятся как значения произвольного вида
+                type_code = b"j"
+        if type_code in _ARRAY_TYPECODES:
+            payload = _to_little_endian(values_array).tobytes()
+        elif type_code == b"s":
+            type_code, payload = _encode_string_column(values)
+        else:
+            payload = _encode_strings(
+                json.dumps(value, ensure_ascii=False) for value in values
+            )
+        codec, payload = _compress(payload)
+
+        encoded_name = name.encode("utf-8")
+        parts.append(_COLUMN_HEADER.pack(len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(
+            _COLUMN_PAYLOAD[COLUMNAR_VERSION].pack(type_code, codec, len(payload))
+        )
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def _read_directory(view):
+    """Читает заголовок колоночного файла и каталог его столбцов.
+
+    Для каждого столбца возвращаются имя, код типа, код сжатия и данные
+    в том виде, в каком они лежат в файле.
+    """
+    magic, version, row_count, column_count = _FILE_HEADER.unpack_from(view)
+    if magic != COLUMNAR_MAGIC or version not in _COLUMN_PAYLOAD:
+        raise ValueError("Неизвестный формат файла таблицы.")
+    column_payload = _COLUMN_PAYLOAD[version]
+    position = _FILE_HEADER.size
+
+    directory = []
+    for _ in range(column_count):
+        (name_size,) = _COLUMN_HEADER.unpack_from(view, position)
+        position += _COLUMN_HEADER.size
+        name = bytes(view[position:position + name_size]).decode("utf-8")
+        position += name_size
+
+        if version == 1:
+            type_code, payload_size = column_payload.unpack_from(view, position)
+            codec = _UNCOMPRESSED
+        else:
+            type_code, codec, payload_size = column_payload.unpack_from(
+                view, position
+            )
+        position += column_payload.size
+        payload = view[position:position + payload_size]
+        directory.append((name, type_code, codec, payload))
+        position += payload_size
+    return row_count, directory
+
+
+def decode_columnar(buffer):
+    """Декодирует записи таблицы из колоночного бинарного формата."""
+    row_count, directory = _read_directory(memoryview(buffer))
+
+    names, columns, sources = [], [], {}
+    for name, type_code, codec, payload in directory:
+        payload = _decompress(codec, payload)
+        if type_code == b"d":
+            # Одинаковые строки записей - один объект из словаря, а
+            # готовые коды сразу служат столбцом векторного просмотра
+            dictionary, codes = _decode_dictionary(payload, row_count)
+            values = list(map(dictionary.__getitem__, codes))
+            sources[name] = (
+                lambda dictionary=dictionary, codes=codes: dictionary_column(
+                    dictionary, codes
+                )
+            )
+        elif type_code in _ARRAY_TYPECODES:
+            values = array(_ARRAY_TYPECODES[type_code])
+            values.frombytes(payload)
+            values = _to_little_endian(values).tolist()
+            if type_code == b"b":
+                values = [bool(value) for value in values]
+        elif type_code == b"s":
+            values = _decode_strings(payload, row_count)
+        else:
+            values = [
+                json.loads(value) for value in _decode_strings(payload, row_count)
+            ]
+        names.append(name)
+        columns.append(values)
+
+    if not names:
+        return RowList()
+    make_row = row_type(names)
+    table_data = RowList(map(make_row, zip(*columns)))
+    if sources:
+        table_data.columns = ColumnStore(sources)
+    return table_data
+
+
+def _column_getter(type_code, payload, row_count):
+    """Возвращает функцию чтения значения столбца по номеру строки."""
+    if type_code == b"d":
+        dictionary, codes = _decode_dictionary(payload, row_count, copy=False)
+        return lambda i: dictionary[codes[i]]
+
+    if type_code in _ARRAY_TYPECODES and sys.byteorder == "little":
+        values = payload.cast(_ARRAY_TYPECODES[type_code])
+        if type_code == b"b":
+            return lambda i: bool(values[i])
+        return values.__getitem__
+
+    if type_code in (b"s", b"j"):
+        offsets_size = array(_OFFSET_TYPECODE).itemsize * (row_count + 1)
+        offsets = payload[:offsets_size].cast(_OFFSET_TYPECODE)
+        blob = payload[offsets_size:]
+        if sys.byteorder == "big":
+            offsets = _to_little_endian(array(_OFFSET_TYPECODE, offsets))
+
+        def get_string(i):
+            return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+        if type_code == b"s":
+            return get_string
+        return lambda i: json.loads(get_string(i))
+
+    # Порядок байт платформы не совпадает с файлом - декодируем целиком
+    values = array(_ARRAY_TYPECODES[type_code])
+    values.frombytes(payload)
+    values = _to_little_endian(values)
+    if type_code == b"b":
+        return lambda i: bool(values[i])
+    return values.__getitem__
+
+
+class MappedTable:
+    """Колоночный снимок таблицы, отображенный в память.
+
+    Записи собираются из столбцов только при обращении к ним, поэтому
+    открытие таблицы не зависит от ее размера. Сжатый столбец
+    распаковывается в память при первом обращении к нему.
+    """
+
+    def __init__(self, filepath):
+        with open(filepath, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._row_count, self._directory = _read_directory(memoryview(self._mmap))
+        self._make_row = row_type(name for name, _, _, _ in self._directory)
+        self._payloads = {}
+        self._getters = None
+        # Кэш столбцов для векторного просмотра (см. vector); столбцы,
+        # хранящиеся словарем, он берет из файла
+        self.columns = ColumnStore(
+            {
+                name: lambda k=k: dictionary_column(
+                    *_decode_dictionary(
+                        self._payload(k), self._row_count, copy=False
+                    )
+                )
+                for k, (name, type_code, _, _) in enumerate(self._directory)
+                if type_code == b"d"
+            }
+        )
+
+    def _payload(self, k):
+        """Возвращает распакованные данные столбца с номером k."""
+        if k not in self._payloads:
+            _, _, codec, payload = self._directory[k]
+            self._payloads[k] = _decompress(codec, payload)
+        return self._payloads[k]
+
+    def _getter(self, k):
+        return _column_getter(self._directory[k][1], self._payload(k), self._row_count)
+
+    def __len__(self):
+        return self._row_count
+
+    def _row(self, i):
+        if self._getters is None:
+            self._getters = list(map(self._getter, range(len(self._directory))))
+        return self._make_row([get(i) for get in self._getters])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._row(j) for j in range(*i.indices(self._row_count))]
+        if i < 0:
+            i += self._row_count
+        if not 0 <= i < self._row_count:
+            raise IndexError("Номер записи вне диапазона.")
+        return self._row(i)
+
+    def __iter__(self):
+        for i in range(self._row_count):
+            yield self._row(i)
+
+    def column_values(self, column):
+        """Возвращает значения столбца по порядку записей или None."""
+        if column not in self._make_row._slots:
+            return None
+        k = self._make_row._fields.index(column)
+        if self._directory[k][1] == b"d":
+            dictionary, codes = _decode_dictionary(
+                self._payload(k), self._row_count, copy=False
+            )
+            return list(map(dictionary.__getitem__, codes))
+        return list(map(self._getter(k), range(self._row_count)))
+
+
+def open_mapped_snapshot(table_name):
+    """Открывает колоночный снимок таблицы без загрузки в память."""
+    filepath = get_snapshot_path(table_name, "columnar")
+    try:
+        if os.path.getsize(filepath) == 0:
+            return None
+        return MappedTable(filepath)
+    except (FileNotFoundError, ValueError, struct.error):
+        return None
+
+
+def snapshot_checksum(content):
+    """Возвращает контрольную сумму содержимого снимка (CRC-32)."""
+    return zlib.crc32(content)
+
+
+def encode_snapshot(data, storage):
+    """Кодирует записи таблицы в содержимое файла снимка."""
+    if storage == "columnar":
+        return encode_columnar(data)
+    text = json.dumps(to_dicts(data), indent=4, ensure_ascii=False)
+    return text.encode("utf-8")
+
+
+def read_snapshot_file(filepath, storage, checkpoint=None):
+    """Читает файл снимка; отсутствующий файл дает пустую таблицу.
+
+    Если передано описание контрольной точки, размер и контрольная сумма
+    файла сверяются с ним, а сам файл должен существовать.
+    Поврежденный или пропавший файл вызывает CorruptSnapshotError.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        if checkpoint is not None:
+            raise CorruptSnapshotError(
+                f'Файл "{filepath}" контрольной точки не найден.'
+            ) from None
+        return RowList()
+    if checkpoint is not None and (
+        len(content) != checkpoint["size"]
+        or snapshot_checksum(content) != checkpoint["checksum"]
+    ):
+        raise CorruptSnapshotError(
+            f'Файл "{filepath}" поврежден: контрольная сумма не совпадает.'
+        )
+    try:
+        if storage == "columnar":
+            return decode_columnar(content)
+        return RowList(to_rows(json.loads(content)))
+    except (ValueError, struct.error) as e:
+        raise CorruptSnapshotError(f'Файл "{filepath}" поврежден: {e}') from None
+
+
+def read_snapshot(table_name, storage, checkpoint=None):
+    """Читает снимок таблицы в заданном формате (см. read_snapshot_file)."""
+    return read_snapshot_file(
+        get_snapshot_path(table_name, storage), storage, checkpoint
+    )
@@ -0,0 +1,64 @@
+"""Импорт и экспорт строк таблиц в файлах CSV и JSON Lines."""
+import csv
+import json
+import os
+
+IMPORT_FORMATS = (".csv", ".jsonl")
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def iter_import_rows(filepath, column_names):
+    """Построчно читает файл и выдает значения в порядке столбцов таблицы.
+
+    В CSV-файле первая строка должна содержать имена столбцов, в JSONL
+    каждая строка - объект с именами столбцов в качестве ключей. Если в
+    файле нет какого-то столбца таблицы, выбрасывается ValueError.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(
+            f'Неподдерживаемый формат файла "{extension}". '
+            "Поддерживаемые форматы: csv, jsonl."
+        )
+
+    with open(filepath, "r", encoding="utf-8", newline="") as f:
+        if extension == ".csv":
+            reader = csv.DictReader(f)
+            _check_columns(reader.fieldnames or [], column_names, "заголовке CSV")
+            for row in reader:
+                yield [row.get(name) for name in column_names]
+        else:
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    row = json.loads(line)
+                    if not isinstance(row, dict):
+                        raise ValueError(
+                            f"Строка {line_number} файла не является объектом."
+                        )
+                    _check_columns(row, column_names, f"строке {line_number}")
+                    yield [row[name] for name in column_names]
+
+
+def _check_columns(names, column_names, where):
+    """Проверяет, что в файле есть все столбцы таблицы."""
+    missing = [name for name in column_names if name not in names]
+    if missing:
+        raise ValueError(f"В {where} нет столбцов: {', '.join(missing)}.")
+
+
+def write_export_rows(records, filepath, field_names, export_format):
+    """Построчно записывает записи в файл CSV или JSONL и возвращает их число."""
+    count = 0
+    with open(filepath, "w", encoding="utf-8", newline="") as f:
+        if export_format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(field_names)
+            for record in records:
+                writer.writerow([record.get(field) for field in field_names])
+                count += 1
+        else:
+            for record in records:
+                row = {field: record.get(field) for field in field_names}
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+    return count
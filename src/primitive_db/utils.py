@@ -1,45 +1,597 @@
 import json
 import os
+import re
+from contextlib import ExitStack
 
-from .constants import DATA_DIR, DB_META_PATH
+from .constants import (
+    DATA_DIR,
+    DB_META_PATH,
+    DEFAULT_STORAGE,
+    STORAGE_FORMATS,
+    WAL_COMPACT_THRESHOLD,
+    WAL_FSYNC_POLICY,
+)
+from .indexes import build_index, dump_index, load_index
+from .locks import get_table_lock_path, metadata_lock, table_lock
+from .metrics import increment, timed_function
+from .storage import (
+    CorruptSnapshotError,
+    encode_snapshot,
+    get_snapshot_path,
+    open_mapped_snapshot,
+    read_snapshot,
+    read_snapshot_file,
+    snapshot_checksum,
+    write_atomic,
+)
+from .wal import (
+    append_changes,
+    apply_change,
+    get_journal_file_path,
+    get_log_file_path,
+    has_changes,
+    read_changes,
+    read_journals,
+    read_log_checkpoint,
+    remove_journal,
+    repair_log_tail,
+)
+
+# Размер журнала таблицы, после которого автоматически записывается
+# контрольная точка; 0 - только командой checkpoint
+_checkpoint_settings = {"log_size": WAL_COMPACT_THRESHOLD}
+
+
+def configure_checkpoints(log_size=None):
+    """Меняет размер журнала для автоматической контрольной точки."""
+    if log_size is not None:
+        _checkpoint_settings["log_size"] = log_size
+
+
+# Политика fsync журналов таблиц: "always" или "never"
+_wal_settings = {"fsync": WAL_FSYNC_POLICY}
+
+
+def configure_wal(fsync=None):
+    """Меняет политику fsync при записи в журналы таблиц."""
+    if fsync is not None:
+        _wal_settings["fsync"] = fsync
+
+
+def automatic_checkpoints():
+    """Проверяет, записываются ли контрольные точки без команды checkpoint."""
+    return _checkpoint_settings["log_size"] > 0
+
+
+def checkpoint_due(table_name):
+    """Проверяет, дорос ли журнал таблицы до автоматической контрольной точки."""
+    limit = _checkpoint_settings["log_size"]
+    if not limit:
+        return False
+    try:
+        return os.path.getsize(get_log_file_path(table_name)) >= limit
+    except FileNotFoundError:
+        return False
 
 
 def load_metadata(filepath=DB_META_PATH):
     """Загружает метаданные из JSON-файла."""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with metadata_lock(), open(filepath, 'r', encoding='utf-8') as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
 
 def save_metadata(data, filepath=DB_META_PATH):
     """Сохраняет метаданные в JSON-файл."""
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    with metadata_lock(exclusive=True):
+        write_atomic(filepath, json.dumps(data, indent=4, ensure_ascii=False))
 
 def ensure_data_dir():
     """Создает директорию для данных если не существует."""
     os.makedirs(DATA_DIR, exist_ok=True)
 
 
-def get_table_file_path(table_name):
+def get_table_file_path(table_name, storage=DEFAULT_STORAGE):
     """Возвращает путь к файлу таблицы."""
-    return os.path.join(DATA_DIR, f"{table_name}.json")
+    return get_snapshot_path(table_name, storage)
+
 
+def get_index_file_path(table_name):
+    """Возвращает путь к файлу индексов таблицы."""
+    return os.path.join(DATA_DIR, f"{table_name}.idx.json")
 
-def load_table_data(table_name):
-    """Загружает данные таблицы из JSON-файла."""
-    filepath = get_table_file_path(table_name)
+
+def load_indexes(table_name):
+    """Загружает снимок индексов таблицы."""
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
+        with open(get_index_file_path(table_name), "r", encoding="utf-8") as f:
+            dumped = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {column: load_index(pairs) for column, pairs in dumped.items()}
+
+
+def _dump_indexes(indexes):
+    dumped = {column: dump_index(index) for column, index in indexes.items()}
+    return json.dumps(dumped, ensure_ascii=False)
+
+
+def get_header_file_path(table_name):
+    """Возвращает путь к файлу заголовка таблицы."""
+    return os.path.join(DATA_DIR, f"{table_name}.meta.json")
+
+
+def load_table_header(table_name):
+    """Загружает заголовок таблицы (счетчик ID и служебные сведения)."""
+    try:
+        with open(get_header_file_path(table_name), "r", encoding="utf-8") as f:
             return json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_table_header(table_name, header):
+    """Сохраняет заголовок таблицы."""
+    write_atomic(
+        get_header_file_path(table_name), json.dumps(header, ensure_ascii=False)
+    )
+
+
+def get_table_file_paths(table_name):
+    """Возвращает пути ко всем файлам таблицы."""
+    snapshot_paths = [
+        get_table_file_path(table_name, storage)
+        for storage in sorted(STORAGE_FORMATS)
+    ]
+    return [
+        *snapshot_paths,
+        get_log_file_path(table_name),
+        get_index_file_path(table_name),
+        get_header_file_path(table_name),
+    ]
+
+
+def get_file_stamp(*filepaths):
+    """Возвращает отпечаток файлов: время изменения и размер каждого."""
+    stamp = []
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _pending_path(filepath):
+    """Путь, по которому файл новой контрольной точки ждет ее фиксации."""
+    return f"{filepath}.ckpt"
+
+
+def _previous_path(filepath):
+    """Путь, по которому хранится снимок предыдущей контрольной точки."""
+    return f"{filepath}.prev"
+
+
+def _checkpoint_file_paths(table_name):
+    """Возвращает пути к файлам новой и предыдущей контрольных точек."""
+    snapshot_paths = [
+        get_table_file_path(table_name, storage)
+        for storage in sorted(STORAGE_FORMATS)
+    ]
+    return [
+        *map(_pending_path, snapshot_paths),
+        *map(_previous_path, snapshot_paths),
+        _pending_path(get_index_file_path(table_name)),
+        get_log_file_path(table_name, previous=True),
+    ]
+
+
+def _remove_file(filepath):
+    try:
+        os.remove(filepath)
+    except FileNotFoundError:
+        pass
+
+
+def remove_table_files(table_name):
+    """Удаляет файлы данных, журнала, индексов, заголовка и блокировки таблицы."""
+    with table_lock(table_name, exclusive=True):
+        for filepath in [
+            *get_table_file_paths(table_name),
+            *_checkpoint_file_paths(table_name),
+        ]:
+            _remove_file(filepath)
+    _remove_file(get_table_lock_path(table_name))
+
+
+def _checkpoint_number(header):
+    return header.get("checkpoint", {}).get("number", 0)
+
+
+def _read_checkpoint(table_name, header):
+    """Читает снимок последней контрольной точки, сверяя контрольную сумму.
+
+    Если снимок поврежден, состояние той же точки восстанавливается из
+    снимка предыдущей точки и журнала, свернутого в последнюю.
+    """
+    checkpoint = header.get("checkpoint")
+    try:
+        return read_snapshot(
+            table_name, header.get("storage", DEFAULT_STORAGE), checkpoint
+        ), False
+    except CorruptSnapshotError:
+        previous = header.get("previous_checkpoint")
+        if previous is None:
+            raise
+        filepath = _previous_path(get_snapshot_path(table_name, previous["storage"]))
+        if not os.path.exists(filepath):
+            raise
+    table_data = read_snapshot_file(filepath, previous["storage"], previous)
+    for change in read_changes(table_name, previous["number"], previous=True):
+        apply_change(table_data, change)
+    increment("tables.restored")
+    return table_data, True
+
+
+def load_table_data(table_name, indexes=None, header=None):
+    """Загружает снимок таблицы и применяет журнал изменений.
+
+    Формат снимка берется из заголовка таблицы. Если переданы индексы и
+    заголовок, загруженные через load_indexes и load_table_header,
+    изменения из журнала применяются и к ним. Поврежденный снимок без
+    предыдущей контрольной точки вызывает CorruptSnapshotError.
+    """
+    with table_lock(table_name):
+        if header is None:
+            _recover_if_interrupted(table_name)
+            table_header = load_table_header(table_name)
+        else:
+            table_header = header
+        table_data, restored = _read_checkpoint(table_name, table_header)
+        if restored and header is not None:
+            # Таблица должна попасть в новую контрольную точку
+            header["restored"] = True
+
+        if header is not None and "next_id" not in header:
+            # Таблица сохранена до появления счетчика ID
+            last_id = max((record["ID"] for record in table_data), default=0)
+            header["next_id"] = last_id + 1
+
+        for change in read_changes(table_name, _checkpoint_number(table_header)):
+            apply_change(table_data, change, indexes, header)
+    return table_data
+
+
+@timed_function("load")
+def load_table(table_name):
+    """Загружает данные таблицы вместе с ее индексами и заголовком."""
+    # Снимок, индексы, заголовок и журнал читаются как одно согласованное
+    # состояние: писатель не может свернуть журнал посередине чтения
+    with table_lock(table_name):
+        _recover_if_interrupted(table_name)
+        indexes = load_indexes(table_name)
+        header = load_table_header(table_name)
+        table_data = load_table_data(table_name, indexes, header)
+    return table_data, indexes, header
+
+
+def _mapped_snapshot_intact(table_name, header):
+    """Сверяет размер колоночного снимка с контрольной точкой.
+
+    Отображаемый в память снимок не читается целиком, поэтому его
+    контрольная сумма не проверяется; при несовпадении размера таблица
+    загружается целиком, с проверкой суммы.
+    """
+    checkpoint = header.get("checkpoint")
+    if checkpoint is None:
+        return True
+    try:
+        size = os.path.getsize(get_snapshot_path(table_name, "columnar"))
+    except FileNotFoundError:
+        return False
+    return size == checkpoint["size"]
+
+
+@timed_function("load")
+def open_table(table_name):
+    """Открывает таблицу для чтения.
+
+    Колоночный снимок без непримененных изменений отображается в память
+    и читается лениво, в остальных случаях таблица загружается целиком.
+    """
+    with table_lock(table_name):
+        _recover_if_interrupted(table_name)
+        header = load_table_header(table_name)
+        indexes = load_indexes(table_name)
+        if (
+            header.get("storage") == "columnar"
+            and not has_changes(table_name)
+            and _mapped_snapshot_intact(table_name, header)
+        ):
+            table_data = open_mapped_snapshot(table_name)
+            if table_data is not None:
+                return table_data, indexes, header
+        table_data = load_table_data(table_name, indexes, header)
+    return table_data, indexes, header
+
+
+def count_table_rows(table_name):
+    """Считает записи таблицы по заголовку и журналу, не читая снимок."""
+    with table_lock(table_name):
+        _recover_if_interrupted(table_name)
+        header = load_table_header(table_name)
+        if "row_count" not in header:
+            return len(load_table_data(table_name, header=header))
+
+        row_count = header["row_count"]
+        for change in read_changes(table_name, _checkpoint_number(header)):
+            if change["op"] == "insert":
+                row_count += len(change["records"])
+            elif change["op"] == "delete":
+                row_count -= len(change["ids"])
+    return row_count
+
+
+@timed_function("save")
+def save_table_data(table_name, data, indexes=None, header=None, logged=True):
+    """Записывает контрольную точку: снимок таблицы, индексов и заголовок.
+
+    Новые снимок и индексы сначала пишутся рядом с прежними, затем
+    заголовок с номером точки и контрольной суммой снимка фиксирует ее,
+    и только после этого файлы занимают свои места (см. recover_table).
+    Снимок предыдущей точки и свернутый журнал остаются на случай
+    повреждения нового снимка. logged=False означает, что в данных есть
+    изменения мимо журнала, и предыдущая точка для этого не годится.
+    """
+    ensure_data_dir()
+    with table_lock(table_name, exclusive=True):
+        _recover_if_interrupted(table_name)
+        if indexes is None:
+            indexes = {
+                column: build_index(data, column)
+                for column in load_indexes(table_name)
+            }
+        if header is None:
+            header = load_table_header(table_name)
+            last_id = max((record["ID"] for record in data), default=0)
+            header["next_id"] = max(header.get("next_id", 1), last_id + 1)
+        # Снимок последней точки восстановленной таблицы поврежден, и
+        # предыдущей для новой точки он быть не может
+        if header.pop("restored", False):
+            logged = False
+        storage = header.get("storage", DEFAULT_STORAGE)
+        content = encode_snapshot(data, storage)
+
+        previous = header.get("checkpoint") if logged else None
+        header["row_count"] = len(data)
+        header["indexes"] = list(indexes)
+        header["checkpoint"] = {
+            "number": _checkpoint_number(header) + 1,
+            "storage": storage,
+            "checksum": snapshot_checksum(content),
+            "size": len(content),
+        }
+        if previous is None:
+            header.pop("previous_checkpoint", None)
+        else:
+            header["previous_checkpoint"] = previous
+
+        write_atomic(_pending_path(get_snapshot_path(table_name, storage)), content)
+        if indexes:
+            write_atomic(
+                _pending_path(get_index_file_path(table_name)),
+                _dump_indexes(indexes),
+            )
+        # Запись заголовка - момент фиксации контрольной точки
+        save_table_header(table_name, header)
+        _finish_checkpoint(table_name, header)
+
+
+def _finish_checkpoint(table_name, header):
+    """Ставит файлы зафиксированной контрольной точки на их места.
+
+    Каждый шаг проверяет, не выполнен ли он раньше, поэтому прерванное
+    завершение можно просто повторить.
+    """
+    checkpoint = header["checkpoint"]
+    previous = header.get("previous_checkpoint")
+    snapshot_path = get_snapshot_path(table_name, checkpoint["storage"])
+    if os.path.exists(_pending_path(snapshot_path)):
+        if previous is not None:
+            old_path = get_snapshot_path(table_name, previous["storage"])
+            if os.path.exists(old_path):
+                os.replace(old_path, _previous_path(old_path))
+        os.replace(_pending_path(snapshot_path), snapshot_path)
+
+    index_path = get_index_file_path(table_name)
+    if os.path.exists(_pending_path(index_path)):
+        os.replace(_pending_path(index_path), index_path)
+    elif not header.get("indexes"):
+        _remove_file(index_path)
+
+    # Журнал, свернутый в точку, нужен только вместе с предыдущим снимком
+    log_checkpoint = read_log_checkpoint(table_name)
+    if log_checkpoint is not None and log_checkpoint < checkpoint["number"]:
+        if previous is None:
+            _remove_file(get_log_file_path(table_name))
+        else:
+            os.replace(
+                get_log_file_path(table_name),
+                get_log_file_path(table_name, previous=True),
+            )
+    elif log_checkpoint is None:
+        _remove_file(get_log_file_path(table_name, previous=True))
+
+    for storage in STORAGE_FORMATS:
+        if storage != checkpoint["storage"]:
+            _remove_file(get_snapshot_path(table_name, storage))
+        if previous is None or storage != previous["storage"]:
+            _remove_file(_previous_path(get_snapshot_path(table_name, storage)))
+    if previous is None:
+        _remove_file(get_log_file_path(table_name, previous=True))
+
+
+def _temp_file_pattern(table_name):
+    """Регулярное выражение для временных файлов write_atomic этой таблицы."""
+    names = [
+        os.path.basename(filepath)
+        for filepath in [
+            *get_table_file_paths(table_name),
+            *_checkpoint_file_paths(table_name),
+        ]
+    ]
+    return re.compile(
+        "(?:" + "|".join(map(re.escape, names)) + r")\.\d+\.tmp"
+    )
+
+
+def _needs_recovery(table_name, filenames):
+    """Проверяет признаки сбоя: файлы незавершенной записи, оборванный журнал.
+
+    Читается только последний байт журнала, а не файлы таблицы целиком.
+    """
+    pattern = _temp_file_pattern(table_name)
+    pending = {
+        os.path.basename(filepath)
+        for filepath in _checkpoint_file_paths(table_name)
+        if filepath.endswith(".ckpt")
+    }
+    if any(name in pending or pattern.fullmatch(name) for name in filenames):
+        return True
+    try:
+        with open(get_log_file_path(table_name), "rb") as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except FileNotFoundError:
+        return False
+
+
+def _recover_if_interrupted(table_name):
+    """Восстанавливает таблицу, если ее контрольная точка не завершена."""
+    if any(
+        os.path.exists(filepath)
+        for filepath in _checkpoint_file_paths(table_name)
+        if filepath.endswith(".ckpt")
+    ):
+        recover_table(table_name)
+
+
+def recover_table(table_name):
+    """Приводит файлы таблицы к последней зафиксированной контрольной точке.
+
+    Новый снимок, который успел получить контрольную сумму в заголовке,
+    ставится на место, а незафиксированный - удаляется. Удаляются и
+    временные файлы прерванной записи, оборванная последняя запись
+    журнала отрезается.
+    """
+    with table_lock(table_name, exclusive=True):
+        pattern = _temp_file_pattern(table_name)
+        for filename in os.listdir(DATA_DIR):
+            if pattern.fullmatch(filename):
+                _remove_file(os.path.join(DATA_DIR, filename))
+
+        header = load_table_header(table_name)
+        checkpoint = header.get("checkpoint")
+        for storage in STORAGE_FORMATS:
+            filepath = _pending_path(get_snapshot_path(table_name, storage))
+            if not os.path.exists(filepath):
+                continue
+            with open(filepath, "rb") as f:
+                content = f.read()
+            if (
+                checkpoint is None
+                or checkpoint["storage"] != storage
+                or snapshot_checksum(content) != checkpoint["checksum"]
+            ):
+                # Точка не зафиксирована: остается прежний снимок
+                _remove_file(_pending_path(get_index_file_path(table_name)))
+                _remove_file(filepath)
+        if checkpoint is not None:
+            _finish_checkpoint(table_name, header)
+
+        try:
+            with open(get_log_file_path(table_name), "rb+") as f:
+                repair_log_tail(f)
+        except FileNotFoundError:
+            pass
+
+
+def recover_tables():
+    """Восстанавливает после сбоя таблицы с его признаками.
+
+    Проверяются только имена файлов в каталоге данных и концы журналов,
+    поэтому время восстановления зависит от числа поврежденных таблиц, а
+    не от размера базы. Возвращает имена восстановленных таблиц.
+    """
+    try:
+        filenames = os.listdir(DATA_DIR)
+    except FileNotFoundError:
         return []
+    recovered = []
+    for table_name in sorted(load_metadata()):
+        if _needs_recovery(table_name, filenames):
+            recover_table(table_name)
+            recovered.append(table_name)
+    return recovered
+
+
+def _append_changes(table_name, changes, header):
+    """Дописывает изменения в журнал, начатый после последней точки."""
+    number = _checkpoint_number(header)
+    log_checkpoint = read_log_checkpoint(table_name)
+    if log_checkpoint is not None and log_checkpoint < number:
+        # Завершение точки прервалось до переноса свернутого журнала
+        _finish_checkpoint(table_name, header)
+    return append_changes(
+        table_name, changes, number, fsync_policy=_wal_settings["fsync"]
+    )
+
 
+def save_table_change(table_name, change, data, indexes=None, header=None):
+    """Дописывает изменение в журнал, при переполнении сворачивает его."""
+    save_table_changes(table_name, [change], data, indexes, header)
 
-def save_table_data(table_name, data):
-    """Сохраняет данные таблицы в JSON-файл."""
-    filepath = get_table_file_path(table_name)
+
+@timed_function("save")
+def save_table_changes(table_name, changes, data, indexes=None, header=None):
+    """Дописывает группу изменений в журнал одной записью.
+
+    Когда журнал дорастает до размера из configure_checkpoints,
+    записывается контрольная точка.
+    """
     ensure_data_dir()
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
\ No newline at end of file
+    with table_lock(table_name, exclusive=True):
+        log_size = _append_changes(
+            table_name, changes, header or load_table_header(table_name)
+        )
+        limit = _checkpoint_settings["log_size"]
+        if limit and log_size >= limit:
+            save_table_data(table_name, data, indexes, header)
+
+
+def recover_transactions():
+    """Дописывает в журналы таблиц изменения прерванных фиксаций транзакций.
+
+    Изменение таблицы пропускается, если номер последней примененной к ней
+    транзакции (last_txn в заголовке) не меньше номера журнала.
+    """
+    for txn_id, changes in read_journals():
+        with ExitStack() as locks:
+            for table_name in sorted(changes):
+                locks.enter_context(table_lock(table_name, exclusive=True))
+            if not os.path.exists(get_journal_file_path(txn_id)):
+                # Фиксация успела завершиться в другом процессе
+                continue
+
+            metadata = load_metadata()
+            for table_name, table_changes in changes.items():
+                if table_name not in metadata:
+                    continue
+                _, _, header = load_table(table_name)
+                if header.get("last_txn", 0) < txn_id:
+                    _append_changes(table_name, table_changes, header)
+            remove_journal(txn_id)
@@ -0,0 +1,352 @@
+"""Векторный просмотр таблиц: условия проверяются сразу по целым столбцам.
+
+Столбцы таблицы хранятся рядом с записями в виде типизированных
+массивов: int и bool - в array.array, строки - кодами в словаре
+различных значений. Условие WHERE вычисляется в маску над столбцом
+целиком, маски узлов and/or объединяются, и записи собираются только
+для отобранных позиций.
+
+Если установлен NumPy, маски считаются его операциями над массивами.
+Без него используется map() со встроенными методами сравнения: цикл
+идет внутри интерпретатора, без вызова функции-предиката на каждую
+запись. NumPy импортируется только перед первым векторным просмотром.
+
+Столбцы строятся лениво, при первом просмотре по ним, и кэшируются в
+атрибуте columns таблицы; apply_change меняет их вместе с записями.
+Строковые столбцы, которые колоночный снимок хранит словарем, берутся
+из снимка готовыми. Столбцы со значениями разных типов или с пустыми
+значениями векторно не просматриваются - для таких условий остается
+обычный путь.
+"""
+import operator
+from array import array
+from itertools import compress
+
+from .constants import VECTOR_SCAN_THRESHOLD, VECTOR_USE_NUMPY
+from .metrics import increment, timed
+from .rows import delete_runs
+
+_settings = {"threshold": VECTOR_SCAN_THRESHOLD, "numpy": VECTOR_USE_NUMPY}
+
+# Модуль numpy после первой попытки импорта (None - не установлен)
+_numpy = {}
+
+_ARRAY_TYPECODES = {int: "q", bool: "b"}
+_COLUMN_TYPES = {"int": int, "bool": bool, "str": str}
+
+# Проверка значения столбца для оператора сравнения с value: встроенные
+# методы value вызываются из map() без кода на Python
+_VALUE_TESTS = {
+    "=": lambda value: value.__eq__,
+    "!=": lambda value: value.__ne__,
+    "<": lambda value: value.__gt__,
+    "<=": lambda value: value.__ge__,
+    ">": lambda value: value.__lt__,
+    ">=": lambda value: value.__le__,
+}
+
+_NUMPY_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def configure_vector(threshold=None, use_numpy=None):
+    """Меняет порог размера таблицы и использование NumPy."""
+    if threshold is not None:
+        _settings["threshold"] = threshold
+    if use_numpy is not None:
+        _settings["numpy"] = use_numpy
+
+
+def _get_numpy():
+    if not _settings["numpy"]:
+        return None
+    if "module" not in _numpy:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy["module"] = numpy
+    return _numpy["module"]
+
+
+class Column:
+    """Столбец таблицы в виде массива.
+
+    Для строк values - коды значений, dictionary - различные значения
+    в порядке появления, codes - их коды. Массив кодов из снимка может
+    быть уже 32 бит; если новый код в него не помещается, столбец
+    перестраивается.
+    """
+
+    __slots__ = ("kind", "values", "dictionary", "codes")
+
+    def __init__(self, kind, values, dictionary=None, codes=None):
+        self.kind = kind
+        self.values = values
+        self.dictionary = dictionary
+        self.codes = codes
+
+    def _code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        return code
+
+    def extend(self, values):
+        """Дописывает значения; False - они не подходят к типу столбца."""
+        if set(map(type, values)) - {_COLUMN_TYPES[self.kind]}:
+            return False
+        if self.kind == "str":
+            values = list(map(self._code, values))
+        try:
+            self.values.extend(values)
+        except OverflowError:
+            return False
+        return True
+
+    def assign(self, positions, value):
+        """Записывает значение в позиции; False - оно не подходит к столбцу."""
+        if type(value) is not _COLUMN_TYPES[self.kind]:
+            return False
+        if self.kind == "str":
+            value = self._code(value)
+        try:
+            for position in positions:
+                self.values[position] = value
+        except OverflowError:
+            return False
+        return True
+
+
+def build_column(values):
+    """Строит столбец из значений; None - значения разных типов."""
+    types = set(map(type, values))
+    if len(types) != 1:
+        return None
+    (value_type,) = types
+    if value_type is str:
+        dictionary = list(dict.fromkeys(values))
+        codes = {value: code for code, value in enumerate(dictionary)}
+        codes_array = array("i", map(codes.__getitem__, values))
+        return Column("str", codes_array, dictionary, codes)
+    typecode = _ARRAY_TYPECODES.get(value_type)
+    if typecode is None:
+        return None
+    try:
+        return Column(value_type.__name__, array(typecode, values))
+    except OverflowError:
+        return None
+
+
+def dictionary_column(dictionary, values):
+    """Строит строковый столбец из словаря значений и массива их кодов."""
+    codes = {value: code for code, value in enumerate(dictionary)}
+    return Column("str", values, list(dictionary), codes)
+
+
+class ColumnStore:
+    """Кэш столбцов одной таблицы; None - столбец не строится.
+
+    sources - {столбец: функция, возвращающая готовый Column}: так
+    колоночный снимок отдает столбцы, которые хранит словарем. После
+    изменения таблицы непостроенные источники устаревают и забываются.
+    """
+
+    __slots__ = ("_columns", "_sources")
+
+    def __init__(self, sources=None):
+        self._columns = {}
+        self._sources = dict(sources or {})
+
+    def get(self, table_data, name):
+        """Возвращает столбец name, при необходимости строя его."""
+        if name not in self._columns:
+            with timed("columns"):
+                source = self._sources.pop(name, None)
+                if source is not None:
+                    column = source()
+                else:
+                    values = table_data.column_values(name)
+                    column = None if values is None else build_column(values)
+            self._columns[name] = column
+        return self._columns[name]
+
+    def extend(self, records):
+        """Дописывает в построенные столбцы значения новых записей."""
+        self._sources.clear()
+        for name, column in list(self._columns.items()):
+            if column is None:
+                continue
+            try:
+                values = [record[name] for record in records]
+            except KeyError:
+                values = None
+            if values is None or not column.extend(values):
+                del self._columns[name]
+
+    def update(self, positions, values):
+        """Записывает новые значения столбцов {столбец: значение} в позиции."""
+        self._sources.clear()
+        for name, value in values.items():
+            column = self._columns.get(name)
+            # Столбец, не построенный из-за разнотипных значений, после
+            # обновления может стать однотипным
+            if column is None or not column.assign(positions, value):
+                self._columns.pop(name, None)
+
+    def delete(self, runs):
+        """Удаляет из столбцов диапазоны позиций удаленных записей."""
+        self._sources.clear()
+        for column in self._columns.values():
+            if column is not None:
+                delete_runs(column.values, runs)
+
+
+def _store(table_data):
+    if not hasattr(table_data, "column_values"):
+        return None
+    if table_data.columns is None:
+        table_data.columns = ColumnStore()
+    return table_data.columns
+
+
+def _leaf_test(node):
+    """Возвращает проверку значения для листа условия; None - всегда ложь."""
+    kind = node[0]
+    if kind == "in":
+        values = frozenset(value for value in node[2] if value is not None)
+        return values.__contains__
+    if kind == "between":
+        low, high = node[2], node[3]
+        if low is None or high is None:
+            return None
+        return lambda value: low <= value <= high
+    _, _, op, value = node
+    if value is None:
+        return None
+    return _VALUE_TESTS[op](value)
+
+
+def _leaf_values(node):
+    if node[0] == "in":
+        return [value for value in node[2] if value is not None]
+    if node[0] == "between":
+        return [value for value in node[2:] if value is not None]
+    return [] if node[3] is None else [node[3]]
+
+
+def _supported(table_data, store, node):
+    """Проверяет, что столбцы условия построены и значения им подходят."""
+    if node[0] in ("and", "or"):
+        return all(_supported(table_data, store, child) for child in node[1])
+    column = store.get(table_data, node[1])
+    if column is None:
+        return False
+    expected = _COLUMN_TYPES[column.kind]
+    return all(isinstance(value, expected) for value in _leaf_values(node))
+
+
+def _numpy_view(numpy, column):
+    if column.kind == "str":
+        # Ширина кодов зависит от размера словаря
+        return numpy.asarray(memoryview(column.values))
+    dtype = {"int": numpy.int64, "bool": numpy.bool_}
+    return numpy.frombuffer(column.values, dtype=dtype[column.kind])
+
+
+def _equality_code(column, node):
+    """Возвращает код значения для сравнения =/!= со строковым столбцом.
+
+    Такое сравнение проверяется по кодам, без обращения к строкам;
+    None - условие другого вида, -1 - значения нет в словаре.
+    """
+    if column.kind != "str" or node[0] != "cmp" or node[2] not in ("=", "!="):
+        return None
+    return column.codes.get(node[3], -1)
+
+
+def _numpy_leaf(numpy, column, node, test):
+    code = _equality_code(column, node)
+    if code is not None:
+        return _NUMPY_OPERATORS[node[2]](_numpy_view(numpy, column), code)
+    if column.kind == "str":
+        # Условие проверяется один раз для каждого различного значения,
+        # а маска столбца выбирается из результатов по кодам
+        lookup = numpy.fromiter(
+            map(test, column.dictionary), dtype=bool, count=len(column.dictionary)
+        )
+        return lookup[_numpy_view(numpy, column)]
+    values = _numpy_view(numpy, column)
+    if node[0] == "in":
+        return numpy.isin(values, _leaf_values(node))
+    if node[0] == "between":
+        return (values >= node[2]) & (values <= node[3])
+    return _NUMPY_OPERATORS[node[2]](values, node[3])
+
+
+def _python_leaf(column, node, test):
+    code = _equality_code(column, node)
+    if code is not None:
+        return list(map(_VALUE_TESTS[node[2]](code), column.values))
+    if column.kind == "str":
+        lookup = list(map(test, column.dictionary))
+        return list(map(lookup.__getitem__, column.values))
+    return list(map(test, column.values))
+
+
+def _mask(table_data, store, node, numpy):
+    """Вычисляет маску условия, столбцы которого уже построены."""
+    kind = node[0]
+    if kind in ("and", "or"):
+        combine = operator.and_ if kind == "and" else operator.or_
+        masks = [_mask(table_data, store, child, numpy) for child in node[1]]
+        result = masks[0]
+        for mask in masks[1:]:
+            if numpy is not None:
+                result = combine(result, mask)
+            else:
+                result = list(map(combine, result, mask))
+        return result
+
+    column = store.get(table_data, node[1])
+    test = _leaf_test(node)
+    if numpy is None:
+        if test is None:
+            return [False] * len(column.values)
+        return _python_leaf(column, node, test)
+    if test is None:
+        return numpy.zeros(len(column.values), dtype=bool)
+    return _numpy_leaf(numpy, column, node, test)
+
+
+def can_vectorize(table_data, where):
+    """Проверяет, будет ли условие проверено по столбцам таблицы."""
+    if where is None or len(table_data) < max(_settings["threshold"], 1):
+        return False
+    store = _store(table_data)
+    return store is not None and _supported(table_data, store, where)
+
+
+def vector_filter(table_data, where):
+    """Отбирает записи по условию над столбцами таблицы.
+
+    Возвращает итератор по записям в порядке таблицы или None, если
+    таблица мала или условие нельзя вычислить по столбцам.
+    """
+    if not can_vectorize(table_data, where):
+        return None
+    numpy = _get_numpy()
+    mask = _mask(table_data, table_data.columns, where, numpy)
+    increment("scans.vector")
+    if numpy is not None:
+        positions = numpy.flatnonzero(mask).tolist()
+    else:
+        positions = compress(range(len(mask)), mask)
+    return map(table_data.__getitem__, positions)
@@ -0,0 +1,231 @@
+"""Журнал изменений таблиц (write-ahead log)."""
+import json
+import os
+
+from .constants import DATA_DIR, WAL_FSYNC_POLICY
+from .indexes import index_add_many, index_remove_many, record_positions
+from .rows import column_getter, delete_runs, position_runs, row_to_json, to_rows
+from .storage import write_atomic
+
+_record_id = column_getter("ID")
+
+_JOURNAL_PREFIX = "txn-"
+_JOURNAL_SUFFIX = ".journal"
+# Порция, которой читается конец журнала при поиске оборванной записи
+_TAIL_CHUNK = 4096
+
+
+def get_log_file_path(table_name, previous=False):
+    """Возвращает путь к журналу изменений таблицы.
+
+    previous=True - журнал, свернутый в последнюю контрольную точку: он
+    хранится, пока снимок предыдущей точки нужен для восстановления.
+    """
+    suffix = ".prev" if previous else ""
+    return os.path.join(DATA_DIR, f"{table_name}.log{suffix}")
+
+
+def repair_log_tail(f):
+    """Отрезает оборванную последнюю запись журнала, открытого как двоичный.
+
+    Читается только конец файла. Возвращает размер журнала после этого.
+    """
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return 0
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return size
+    position = size
+    end = 0
+    while position > 0:
+        start = max(0, position - _TAIL_CHUNK)
+        f.seek(start)
+        newline = f.read(position - start).rfind(b"\n")
+        if newline != -1:
+            end = start + newline + 1
+            break
+        position = start
+    f.truncate(end)
+    return end
+
+
+def append_changes(table_name, changes, checkpoint=0, fsync_policy=WAL_FSYNC_POLICY):
+    """Дописывает группу изменений одной записью и возвращает размер журнала.
+
+    Новый журнал начинается с отметки номера контрольной точки, после
+    которой сделаны его изменения.
+    """
+    lines = "".join(
+        json.dumps(change, ensure_ascii=False, default=row_to_json) + "\n"
+        for change in changes
+    )
+    with open(get_log_file_path(table_name), "ab+") as f:
+        if not repair_log_tail(f):
+            lines = json.dumps({"checkpoint": checkpoint}) + "\n" + lines
+        f.write(lines.encode("utf-8"))
+        f.flush()
+        if fsync_policy == "always":
+            os.fsync(f.fileno())
+        return f.tell()
+
+
+def read_log_checkpoint(table_name, previous=False):
+    """Возвращает номер контрольной точки, с которой начат журнал.
+
+    Журнал без отметки (записанный до появления контрольных точек)
+    считается начатым с точки 0; отсутствующий журнал дает None.
+    """
+    try:
+        with open(get_log_file_path(table_name, previous), "rb") as f:
+            line = f.readline()
+    except FileNotFoundError:
+        return None
+    try:
+        first = json.loads(line)
+    except ValueError:
+        return 0
+    if isinstance(first, dict) and "op" not in first:
+        return first.get("checkpoint", 0)
+    return 0
+
+
+def read_changes(table_name, checkpoint=0, previous=False):
+    """Последовательно читает изменения из журнала таблицы.
+
+    Журнал, начатый до контрольной точки checkpoint, уже свернут в ее
+    снимок, и изменения из него не выдаются.
+    """
+    try:
+        with open(
+            get_log_file_path(table_name, previous), "r", encoding="utf-8"
+        ) as f:
+            first = True
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя запись - дальше читать нечего
+                    return
+                if first:
+                    first = False
+                    marked = "op" not in change
+                    if (change.get("checkpoint", 0) if marked else 0) < checkpoint:
+                        return
+                    if marked:
+                        continue
+                yield change
+    except FileNotFoundError:
+        return
+
+
+def has_changes(table_name):
+    """Проверяет, есть ли в журнале таблицы непримененные к снимку изменения."""
+    try:
+        return os.path.getsize(get_log_file_path(table_name)) > 0
+    except FileNotFoundError:
+        return False
+
+
+def get_journal_file_path(txn_id):
+    """Возвращает путь к журналу фиксации транзакции."""
+    return os.path.join(DATA_DIR, f"{_JOURNAL_PREFIX}{txn_id}{_JOURNAL_SUFFIX}")
+
+
+def write_journal(txn_id, changes):
+    """Сохраняет изменения транзакции {таблица: [изменение, ...]} до фиксации."""
+    write_atomic(
+        get_journal_file_path(txn_id),
+        json.dumps(changes, ensure_ascii=False, default=row_to_json),
+    )
+
+
+def remove_journal(txn_id):
+    """Удаляет журнал зафиксированной транзакции."""
+    try:
+        os.remove(get_journal_file_path(txn_id))
+    except FileNotFoundError:
+        pass
+
+
+def read_journals():
+    """Перечисляет журналы незавершенных фиксаций: (номер, изменения)."""
+    try:
+        filenames = sorted(os.listdir(DATA_DIR))
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        if not (
+            filename.startswith(_JOURNAL_PREFIX)
+            and filename.endswith(_JOURNAL_SUFFIX)
+        ):
+            continue
+        txn_id = filename[len(_JOURNAL_PREFIX):-len(_JOURNAL_SUFFIX)]
+        try:
+            with open(os.path.join(DATA_DIR, filename), encoding="utf-8") as f:
+                yield int(txn_id), json.load(f)
+        except (FileNotFoundError, ValueError):
+            # Журнал уже удален фиксирующим процессом
+            continue
+
+
+def apply_change(table_data, change, indexes=None, header=None):
+    """Применяет изменение из журнала к данным, индексам и заголовку таблицы."""
+    indexes = indexes or {}
+    op = change["op"]
+    # Кэш столбцов векторного просмотра, если он есть у таблицы
+    columns = getattr(table_data, "columns", None)
+    if header is not None and "txn" in change:
+        # Номер последней зафиксированной транзакции нужен при восстановлении
+        header["last_txn"] = max(header.get("last_txn", 0), change["txn"])
+    if op == "insert":
+        # Записи из журнала прочитаны словарями
+        records = to_rows(change["records"])
+        table_data.extend(records)
+        if columns is not None:
+            columns.extend(records)
+        if header is not None:
+            last_id = max(map(_record_id, records))
+            header["next_id"] = max(header.get("next_id", 1), last_id + 1)
+        for column, index in indexes.items():
+            get_value = column_getter(column)
+            index_add_many(
+                index, [(get_value(record), _record_id(record)) for record in records]
+            )
+    elif op == "update":
+        # Меняются только найденные по ID записи, список остается прежним
+        positions = record_positions(table_data, change["ids"])
+        records = [table_data[position] for position in positions]
+        for column, value in change["set"].items():
+            if column in indexes:
+                index_remove_many(
+                    indexes[column],
+                    [(record.get(column), _record_id(record)) for record in records],
+                )
+                index_add_many(
+                    indexes[column], [(value, _record_id(record)) for record in records]
+                )
+        for record in records:
+            record.update(change["set"])
+        if columns is not None:
+            columns.update(positions, change["set"])
+    elif op == "delete":
+        # Из списка вырезаются только диапазоны удаленных записей,
+        # порядок остальных по ID сохраняется
+        positions = record_positions(table_data, change["ids"])
+        for column, index in indexes.items():
+            index_remove_many(
+                index,
+                [
+                    (table_data[position].get(column), _record_id(table_data[position]))
+                    for position in positions
+                ],
+            )
+        runs = position_runs(positions)
+        delete_runs(table_data, runs)
+        if columns is not None:
+            columns.delete(runs)
+    return table_data